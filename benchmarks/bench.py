@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measures parse and write throughput on synthetic levels.
+
+Run from the repository root:
+
+    python -m benchmarks.bench --vertices 250000 --entities 20000
+    python -m benchmarks.bench --save baseline.json
+    python -m benchmarks.bench --baseline baseline.json --threshold 0.1
+
+Every case is run --repeat times on a generated level and the best time
+is reported as MB/s of level file and elements/s (vertices, edges,
+faces, triangles and entities). With --baseline, each case is compared
+against the stored result and the exit status is 1 if any case got
+slower by more than the threshold. The exit status is also 1 if the
+vectorized mesh of the level is not written back byte for byte.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from benchmarks import harness
+from benchmarks.levelgen import LevelGenerator
+from levelreader import LevelReader
+from parsers.levelparser import LevelParser
+
+try:
+    import numpy
+    from elements.mesharrays import ChunkMeshArrays
+except ImportError:
+    numpy = None
+
+
+def level_elements(filename):
+    with LevelParser(filename, vectorized=numpy is not None) as parser:
+        parser.parse()
+        mesh = parser.get_mesh()
+        entities = len(parser.get_entities())
+    if numpy is not None:
+        return mesh.num_vertices() + mesh.num_edges() + mesh.num_faces() + len(mesh.triangles) + entities
+    return (len(mesh["vertices"]) + len(mesh["edges"]) + len(mesh["faces"]) + mesh["triangles"]["total"] +
+            entities)
+
+
+def mesh_round_trips(filename):
+    """Returns whether the vectorized mesh is written back byte for byte"""
+    with LevelParser(filename, vectorized=True) as parser:
+        parser.parse()
+        for (chunk_id, offset, chunk_length) in parser.toc:
+            if chunk_id == 2:
+                return ChunkMeshArrays(parser.get_mesh()).dump() == parser.data[offset - 8:offset + chunk_length]
+    return True
+
+
+def parse(filename, **options):
+    with LevelParser(filename, **options) as parser:
+        parser.parse()
+
+
+def read_level(filename, vectorized=False):
+    reader = LevelReader(vectorized)
+    reader.read_level(filename)
+
+
+def write_level(filename, vectorized=False):
+    reader = LevelReader(vectorized)
+    reader.read_level(filename)
+    output = filename + ".written"
+    start = time.time()
+    reader.write_level(output)
+    elapsed = time.time() - start
+    os.remove(output)
+    return elapsed
+
+
+def cases():
+    yield ("parse", lambda filename: parse(filename))
+    yield ("parse_mmap", lambda filename: parse(filename, use_mmap=True))
+    yield ("read_level", lambda filename: read_level(filename))
+    yield ("write_level", lambda filename: write_level(filename))
+    if numpy is not None:
+        yield ("parse_vectorized", lambda filename: parse(filename, use_mmap=True, vectorized=True))
+        yield ("read_level_vectorized", lambda filename: read_level(filename, True))
+        yield ("write_level_vectorized", lambda filename: write_level(filename, True))
+
+
+def run_case(function, filename, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        elapsed = function(filename)
+        if elapsed is None:
+            elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(filename, repeat=3, only=None):
+    size = os.path.getsize(filename)
+    elements = level_elements(filename)
+    results = {}
+    for (name, function) in cases():
+        if only and name not in only:
+            continue
+        seconds = run_case(function, filename, repeat)
+        results[name] = {
+            "seconds": seconds,
+            "mb_per_s": size / seconds / 1e6,
+            "elements_per_s": elements / seconds
+        }
+    return results
+
+
+def report(results, baseline=None, threshold=0.1, output=sys.stdout):
+    regressions = []
+    output.write("%-24s %10s %10s %14s %9s\n" % ("case", "seconds", "MB/s", "elements/s", "change"))
+    for name in sorted(results):
+        result = results[name]
+        (change, is_regression) = harness.change(result["seconds"], baseline, name, "seconds", threshold)
+        if is_regression:
+            regressions.append(name)
+        output.write("%-24s %10.4f %10.2f %14.0f %9s\n" % (name, result["seconds"], result["mb_per_s"],
+                                                           result["elements_per_s"], change))
+    return regressions
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(prog="python -m benchmarks.bench",
+                                        description="Benchmarks level parsing and writing.")
+    argparser.add_argument("--vertices", type=int, default=100000)
+    argparser.add_argument("--entities", type=int, default=5000)
+    argparser.add_argument("--repeat", type=int, default=3)
+    argparser.add_argument("--case", action="append", dest="cases", help="only run this case (repeatable)")
+    harness.add_arguments(argparser, "slowdown")
+    options = argparser.parse_args(args)
+
+    generate = LevelGenerator(options.vertices, options.entities).write
+    description = "synthetic, %d vertices, %d entities" % (options.vertices, options.entities)
+    with harness.benchmark_level(options.level, generate, description) as filename:
+        round_trip = numpy is None or mesh_round_trips(filename)
+        results = run(filename, options.repeat, options.cases)
+
+    regressions = harness.finish(results, options, report)
+    if not round_trip:
+        sys.stdout.write("mesh round trip: the vectorized mesh chunk was not written back unchanged\n")
+        return 1
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Command line harness shared by the benchmarks: the --level, --save,
+--baseline and --threshold options, the temporary level and the
+comparison against a stored baseline."""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+
+def add_arguments(argparser, growth):
+    """Adds the options of the harness; growth names what is compared
+    against the baseline, such as "slowdown"."""
+    argparser.add_argument("--level", help="benchmark this level file instead of a generated one")
+    argparser.add_argument("--save", metavar="FILE", help="store the results as a baseline")
+    argparser.add_argument("--baseline", metavar="FILE", help="compare against a stored baseline")
+    argparser.add_argument("--threshold", type=float, default=0.1,
+                           help="relative %s reported as a regression (default: 0.1)" % (growth))
+
+
+@contextlib.contextmanager
+def benchmark_level(level, generate, description):
+    """Yields the path of a copy of level in a temporary directory, or if
+    level is None of a level written there by generate(filename).
+    description names the generated level in the output."""
+    directory = tempfile.mkdtemp(prefix="ns2lr-bench-")
+    try:
+        if level is None:
+            filename = os.path.join(directory, "synthetic.level")
+            generate(filename)
+        else:
+            filename = shutil.copy(level, directory)
+        sys.stdout.write("level: %s (%.1f MB)\n" % (level or description, os.path.getsize(filename) / 1e6))
+        yield filename
+    finally:
+        shutil.rmtree(directory)
+
+
+def change(value, baseline, name, key, threshold):
+    """Returns (text, is_regression) of value against baseline[name][key]"""
+    if not baseline or name not in baseline or not baseline[name][key]:
+        return ("", False)
+    ratio = value / baseline[name][key] - 1.0
+    text = "%+.1f%%" % (100 * ratio)
+    if ratio > threshold:
+        return (text + " !", True)
+    return (text, False)
+
+
+def finish(results, options, report):
+    """Prints results with report(results, baseline, threshold), which
+    returns the names of the regressions, and saves them if asked.
+    Returns the regressions."""
+    baseline = None
+    if options.baseline:
+        with io.open(options.baseline, "r") as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, options.threshold)
+    if options.save:
+        with io.open(options.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return regressions
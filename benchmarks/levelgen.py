@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generates synthetic version 10 level files of configurable size.
+
+The mesh is a grid of quad faces over a gently sloped floor. Every face
+has a border edge loop of four grid edges and two triangles, and every
+hole_every-th face has an extra hole edge loop. Entities stand on the
+floor and carry one property of every property type.
+"""
+
+import argparse
+import math
+import random
+import sys
+from struct import pack
+
+CLASSNAMES = (
+    "info_player_start",
+    "resource_point",
+    "tech_point",
+    "light_point",
+    "prop_static",
+    "ambient_sound",
+    "location"
+)
+
+
+def chunk(chunk_id, parts):
+    data = b"".join(parts)
+    return pack("II", chunk_id, len(data)) + data
+
+
+def widestring(value):
+    encoded = value.encode("utf-16-le")
+    return pack("I", len(encoded) // 2) + encoded
+
+
+def floor_height(x, z):
+    return 0.05 * x + 0.02 * z
+
+
+class LevelGenerator(object):
+
+    def __init__(self, vertices=10000, entities=1000, hole_every=7, mapping_groups=16,
+                 geometry_groups=8, layers=4, spacing=1.0, seed=1):
+        self.size = max(2, int(math.ceil(math.sqrt(vertices))))
+        self.num_entities = entities
+        self.hole_every = hole_every
+        self.num_mapping_groups = mapping_groups
+        self.num_geometry_groups = geometry_groups
+        self.num_layers = layers
+        self.spacing = spacing
+        self.random = random.Random(seed)
+
+    def vertex_index(self, i, j):
+        return j * self.size + i
+
+    def horizontal_edge(self, i, j):
+        return j * (self.size - 1) + i
+
+    def vertical_edge(self, i, j):
+        return self.size * (self.size - 1) + i * (self.size - 1) + j
+
+    def generate(self):
+        parts = [b"LVL", pack("B", 10)]
+        parts.append(self.mesh_chunk())
+        parts.append(self.layers_chunk())
+        parts.append(self.groups_chunk())
+        for i in range(self.num_entities):
+            parts.append(self.entity_chunk(i))
+        parts.append(chunk(4, [widestring("<viewport><camera/></viewport>")]))
+        parts.append(chunk(6, [pack("I", 2), pack("BBBB", 255, 0, 0, 255), pack("BBBB", 0, 0, 255, 255)]))
+        parts.append(chunk(7, [pack("IIII", 0, 0, 0, 0)]))
+        return b"".join(parts)
+
+    def write(self, filename):
+        with open(filename, "wb") as f:
+            f.write(self.generate())
+
+    def mesh_chunk(self):
+        size = self.size
+        cells = size - 1
+        num_faces = cells * cells
+        spacing = self.spacing
+
+        parts = [chunk(4, [pack("I", 2)] + [pack("I", len(m)) + m for m in (
+            b"materials/dev/dev_floor_grid.material", b"materials/dev/dev_1024x1024.material")])]
+
+        vertices = [pack("I", size * size)]
+        for j in range(size):
+            for i in range(size):
+                x = i * spacing
+                z = j * spacing
+                vertices.append(pack("fffB", x, floor_height(x, z), z, (i + j) % 2))
+        parts.append(chunk(1, vertices))
+
+        edges = [pack("I", 2 * size * cells)]
+        for j in range(size):
+            for i in range(cells):
+                edges.append(pack("IIB", self.vertex_index(i, j), self.vertex_index(i + 1, j), 0))
+        for i in range(size):
+            for j in range(cells):
+                edges.append(pack("IIB", self.vertex_index(i, j), self.vertex_index(i, j + 1), j % 2))
+        parts.append(chunk(2, edges))
+
+        faces = [pack("I", num_faces)]
+        for j in range(cells):
+            for i in range(cells):
+                face = j * cells + i
+                has_hole = self.hole_every and face % self.hole_every == 0
+                mapping_group = 0xFFFFFFFF
+                if self.num_mapping_groups and face % 3 == 0:
+                    mapping_group = face % self.num_mapping_groups
+                faces.append(pack("fffffIII", 0.0, 0.25 * (face % 4), 0.0, 1.0, 1.0,
+                                  mapping_group, face % 2, int(bool(has_hole))))
+                faces.append(pack("I", 4))
+                faces.append(pack("II", 0, self.horizontal_edge(i, j)))
+                faces.append(pack("II", 0, self.vertical_edge(i + 1, j)))
+                faces.append(pack("II", 1, self.horizontal_edge(i, j + 1)))
+                faces.append(pack("II", 1, self.vertical_edge(i, j)))
+                if has_hole:
+                    faces.append(pack("I", 3))
+                    faces.append(pack("II", 0, self.horizontal_edge(i, j)))
+                    faces.append(pack("II", 1, self.vertical_edge(i + 1, j)))
+                    faces.append(pack("II", 0, self.vertical_edge(i, j)))
+        parts.append(chunk(3, faces))
+
+        facelayers = [pack("II", num_faces, 2)]
+        for face in range(num_faces):
+            if self.num_layers and face % 5 == 0:
+                facelayers.append(pack("III", 1, 1, 1 << (face % self.num_layers)))
+            else:
+                facelayers.append(pack("I", 0))
+        parts.append(chunk(6, facelayers))
+
+        mappinggroups = [pack("I", self.num_mapping_groups)]
+        for mgid in range(self.num_mapping_groups):
+            mappinggroups.append(pack("Iffffffff", mgid, 0.1 * mgid, 1.0, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0))
+        parts.append(chunk(7, mappinggroups))
+
+        geometrygroups = []
+        for count in (size * size, 2 * size * cells, num_faces):
+            geometrygroups.append(pack("I", self.num_geometry_groups))
+            for gid in range(self.num_geometry_groups):
+                indices = list(range(gid, count, self.num_geometry_groups * 2))
+                if gid % 2:
+                    # members are kept in the order they were added, not sorted
+                    indices.reverse()
+                geometrygroups.append(pack("II", gid, len(indices)))
+                geometrygroups.append(pack("%dI" % len(indices), *indices))
+        parts.append(chunk(8, geometrygroups))
+
+        normals = ((0.0, 1.0, 0.0), (0.05, 0.998, 0.02))
+        triangles = [pack("I", 0)]
+        triangles.append(pack("I", len(normals)))
+        for normal in normals:
+            triangles.append(pack("fff", *normal))
+        triangles.append(pack("II", num_faces, 2 * num_faces))
+        for j in range(cells):
+            for i in range(cells):
+                v00 = self.vertex_index(i, j)
+                v10 = self.vertex_index(i + 1, j)
+                v01 = self.vertex_index(i, j + 1)
+                v11 = self.vertex_index(i + 1, j + 1)
+                triangles.append(pack("I", 2))
+                triangles.append(pack("IIIIII", v00, v11, v10, 0, 1, 0))
+                triangles.append(pack("IIIIII", v00, v01, v11, 0, 1, 1))
+        parts.append(chunk(5, triangles))
+
+        return chunk(2, parts)
+
+    def layers_chunk(self):
+        parts = [pack("I", self.num_layers)]
+        for layer_id in range(self.num_layers):
+            parts.append(widestring("Layer %d" % layer_id))
+            parts.append(pack("I", 1))
+            parts.append(pack("BBBB", 40 * layer_id % 256, 128, 200, 255))
+            parts.append(pack("I", layer_id))
+        return chunk(3, parts)
+
+    def groups_chunk(self):
+        parts = [pack("I", 2)]
+        for group_id in (1, 2):
+            parts.append(widestring("Group %d" % group_id))
+            parts.append(pack("I", group_id % 2))
+            parts.append(pack("BBBB", 0, 255, 0, 255))
+            parts.append(pack("I", group_id))
+        return chunk(5, parts)
+
+    def entity_chunk(self, i):
+        rng = self.random
+        extent = (self.size - 1) * self.spacing
+        x = rng.uniform(0.0, extent)
+        z = rng.uniform(0.0, extent)
+        classname = CLASSNAMES[i % len(CLASSNAMES)].encode("utf-8")
+
+        parts = []
+        if self.num_layers and i % 4 == 0:
+            parts.append(pack("IIII", 1, 2, 1, 1 << (i % self.num_layers)))
+        else:
+            parts.append(pack("I", 0))
+        parts.append(pack("II", i % 3, len(classname)))
+        parts.append(classname)
+
+        properties = [
+            ("origin", 6, (x, floor_height(x, z), z)),
+            ("angles", 7, (0.0, rng.uniform(-3.14, 3.14), 0.0)),
+            ("color", 5, (1.0, 0.5, 0.25, 1.0)),
+            ("intensity", 2, (rng.uniform(0.0, 10.0),)),
+            ("falloff", 8, (0.5,)),
+            ("radius", 9, (rng.uniform(1.0, 20.0),)),
+            ("name", 0, "entity_%d" % i),
+            ("model", 4, "models/props/prop_%d.model" % (i % 10)),
+            ("enabled", 1, i % 2 == 0),
+            ("teamNumber", 3, i % 3),
+            ("mode", 10, i % 4)
+        ]
+        parts.append(pack("I", len(properties)))
+        for (name, prop_type, value) in properties:
+            parts.append(chunk(2, self.property(name, prop_type, value)))
+        return chunk(1, parts)
+
+    def property(self, name, prop_type, value):
+        encoded = name.encode("utf-8")
+        parts = [pack("I", len(encoded)), encoded]
+        if prop_type in (2, 5, 6, 7, 8, 9):
+            parts.append(pack("III", prop_type, len(value), 0))
+            parts.append(pack("%df" % len(value), *value))
+        elif prop_type in (0, 4):
+            parts.append(pack("III", prop_type, 1, 0))
+            parts.append(widestring(value))
+        elif prop_type == 1:
+            parts.append(pack("IIII", prop_type, 1, 0, int(value)))
+        else:
+            parts.append(pack("IIIi", prop_type, 1, 0, value))
+        return parts
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(description="Writes a synthetic level file.")
+    argparser.add_argument("filename")
+    argparser.add_argument("--vertices", type=int, default=10000)
+    argparser.add_argument("--entities", type=int, default=1000)
+    argparser.add_argument("--hole-every", type=int, default=7)
+    argparser.add_argument("--mapping-groups", type=int, default=16)
+    argparser.add_argument("--geometry-groups", type=int, default=8)
+    argparser.add_argument("--seed", type=int, default=1)
+    options = argparser.parse_args(args)
+    generator = LevelGenerator(options.vertices, options.entities, options.hole_every,
+                               options.mapping_groups, options.geometry_groups, seed=options.seed)
+    generator.write(options.filename)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measures the memory of the mesh element objects of elements/Elements.py.
+
+Run from the repository root:
+
+    python -m benchmarks.memory --vertices 100000
+    python -m benchmarks.memory --save memory.json
+    python -m benchmarks.memory --baseline memory.json
+
+A synthetic level is parsed into dicts first, then the element objects
+are built from them as LevelReader.read_mesh() does, one class at a
+time, under tracemalloc. The values are already decoded at that point,
+so the bytes per element are those of the objects themselves. With
+--baseline, each class is compared against the stored result and the
+exit status is 1 if any class grew by more than the threshold.
+"""
+
+import argparse
+import sys
+import tracemalloc
+
+from benchmarks import harness
+from benchmarks.levelgen import LevelGenerator
+from elements.Elements import (Vertex, Edge, EdgeLoop, Face, Vector, Triangle, Facelayer, Mappinggroup,
+                               Geometrygroup)
+from parsers.levelparser import LevelParser
+
+
+def read_mesh(filename):
+    with LevelParser(filename) as parser:
+        parser.parse()
+        return parser.get_mesh()
+
+
+def cases(mesh):
+    """Yields (class name, function building its elements from mesh), in
+    the order of LevelReader.read_mesh(). The functions return the number
+    of elements built and take the elements built so far."""
+    def vertices(built):
+        built["vertices"] = [Vertex(i, vertex["x"], vertex["y"], vertex["z"], vertex["has_smoothing"])
+                             for i, vertex in enumerate(mesh["vertices"])]
+        return len(built["vertices"])
+
+    def edges(built):
+        vertices = built["vertices"]
+        built["edges"] = [Edge(i, vertices[edge["vi_1"]], vertices[edge["vi_2"]], edge["smooth"])
+                          for i, edge in enumerate(mesh["edges"])]
+        return len(built["edges"])
+
+    def edgeloops(built):
+        edges = built["edges"]
+        built["edgeloops"] = [[EdgeLoop([{"edge": edges[edge["edge_index"]], "is_flipped": edge["is_flipped"]}
+                                         for edge in edgeloop])
+                               for edgeloop in [face["border_edgeloop"]] + face["edgeloops"]]
+                              for face in mesh["faces"]]
+        return sum(len(edgeloops) for edgeloops in built["edgeloops"])
+
+    def faces(built):
+        built["faces"] = [Face(i, edgeloops[0], face["materialid"], face["scale"], face["offset"],
+                               face["angle"], face["mapping_group_id"], edgeloops[1:])
+                          for i, (face, edgeloops) in enumerate(zip(mesh["faces"], built["edgeloops"]))]
+        return len(built["faces"])
+
+    def vectors(built):
+        built["normals"] = [Vector(i, *normal) for i, normal in enumerate(mesh["smoothed_normals"])]
+        return len(built["normals"])
+
+    def triangles(built):
+        (vertices, normals) = (built["vertices"], built["normals"])
+        built["triangles"] = [[Triangle(vertices[triangle["vi_1"]], vertices[triangle["vi_2"]],
+                                        vertices[triangle["vi_3"]], normals[triangle["sni_1"]],
+                                        normals[triangle["sni_2"]], normals[triangle["sni_3"]])
+                               for triangle in face_triangles]
+                              for face_triangles in mesh["triangles"]["faces"]]
+        return sum(len(face_triangles) for face_triangles in built["triangles"])
+
+    def facelayers(built):
+        built["facelayers"] = [Facelayer(facelayer) for facelayer in mesh["face_layers"]]
+        return len(built["facelayers"])
+
+    def mappinggroups(built):
+        built["mappinggroups"] = [Mappinggroup(gid, group["angle"], group["scale"], group["offset"], group["normal"])
+                                  for gid, group in mesh["mapping_groups"].items()]
+        return len(built["mappinggroups"])
+
+    def geometrygroups(built):
+        built["geometrygroups"] = [Geometrygroup(gid, indices)
+                                   for kind in ("vertexgroups", "edgegroups", "facegroups")
+                                   for gid, indices in mesh["geometry_groups"][kind].items()]
+        return len(built["geometrygroups"])
+
+    yield ("Vertex", vertices)
+    yield ("Edge", edges)
+    yield ("EdgeLoop", edgeloops)
+    yield ("Face", faces)
+    yield ("Vector", vectors)
+    yield ("Triangle", triangles)
+    yield ("Facelayer", facelayers)
+    yield ("Mappinggroup", mappinggroups)
+    yield ("Geometrygroup", geometrygroups)
+
+
+def run(filename):
+    mesh = read_mesh(filename)
+    results = {}
+    built = {}
+    tracemalloc.start()
+    try:
+        for (name, function) in cases(mesh):
+            before = tracemalloc.get_traced_memory()[0]
+            count = function(built)
+            size = tracemalloc.get_traced_memory()[0] - before
+            results[name] = {
+                "elements": count,
+                "bytes": size,
+                "bytes_per_element": float(size) / count if count else 0.0
+            }
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def report(results, baseline=None, threshold=0.1, output=sys.stdout):
+    regressions = []
+    output.write("%-16s %10s %14s %9s\n" % ("element", "count", "bytes/element", "change"))
+    for (name, result) in results.items():
+        (change, is_regression) = harness.change(result["bytes_per_element"], baseline, name,
+                                                 "bytes_per_element", threshold)
+        if is_regression:
+            regressions.append(name)
+        output.write("%-16s %10d %14.1f %9s\n" % (name, result["elements"], result["bytes_per_element"], change))
+    return regressions
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(prog="python -m benchmarks.memory",
+                                        description="Benchmarks the memory of mesh element objects.")
+    argparser.add_argument("--vertices", type=int, default=100000)
+    harness.add_arguments(argparser, "growth")
+    options = argparser.parse_args(args)
+
+    generate = LevelGenerator(options.vertices, 0).write
+    with harness.benchmark_level(options.level, generate, "synthetic, %d vertices" % (options.vertices)) as filename:
+        results = run(filename)
+
+    regressions = harness.finish(results, options, report)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
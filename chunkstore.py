@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+from struct import pack
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import errors
+from parsers.chunkmeshparser import iter_subchunks
+from parsers.levelparser import LevelParser
+
+
+class ChunkStore(object):
+
+    """Archive of level revisions that stores every distinct chunk once.
+
+    Levels are split into their top-level chunks, and mesh chunks further
+    into their sub-chunks. Each chunk body is keyed by its SHA-256 and
+    appended to a single pack file the first time it is seen, so the new
+    chunks of a revision are contiguous in the pack. A revision is a small
+    JSON manifest listing its chunks in file order with their hash and pack
+    range; get() rebuilds the level from it alone, with reads in pack
+    order, merging adjacent ranges.
+
+    Layout of the store directory:
+
+        pack            chunk bodies, appended
+        index           "hash offset length" lines of the pack, appended
+        lock            held by add() while it appends
+        manifests/NAME/REVISION.json
+
+    add() holds an exclusive lock on the lock file, so that several
+    processes can add to one store. Where fcntl is not available, only
+    one process may add at a time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pack_path = os.path.join(directory, "pack")
+        self.index_path = os.path.join(directory, "index")
+        self.lock_path = os.path.join(directory, "lock")
+        self.manifest_directory = os.path.join(directory, "manifests")
+        if not os.path.isdir(self.manifest_directory):
+            os.makedirs(self.manifest_directory)
+
+    @contextlib.contextmanager
+    def lock(self):
+        with io.open(self.lock_path, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def read_index(self):
+        """Returns {hash: [offset, length]} of the pack"""
+        index = {}
+        try:
+            with io.open(self.index_path, "r") as f:
+                for line in f:
+                    fields = line.split()
+                    # a line cut short by an interrupted add() is ignored
+                    if len(fields) == 3:
+                        index[fields[0]] = [int(fields[1]), int(fields[2])]
+        except (IOError, OSError):
+            pass
+        return index
+
+    def replace(self, path, data):
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with io.open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def revisions(self, name):
+        """Returns the revision numbers stored for name, oldest first"""
+        directory = os.path.join(self.manifest_directory, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(os.path.splitext(entry)[0]) for entry in os.listdir(directory) if entry.endswith(".json"))
+
+    def manifest_path(self, name, revision):
+        return os.path.join(self.manifest_directory, name, "%d.json" % revision)
+
+    def add(self, filename, name=None):
+        """Stores a level file as the next revision of name, by default the
+        file name without extension. Returns the revision number."""
+        if name is None:
+            name = os.path.splitext(os.path.basename(filename))[0]
+        with self.lock(), LevelParser(filename, use_mmap=True, lazy=True) as parser:
+            parser.parse()
+            index = self.read_index()
+            added = []
+            manifest = {"version": parser.version, "chunks": []}
+            with io.open(self.pack_path, "ab") as pack_file:
+                pack_file.seek(0, io.SEEK_END)
+                for (chunk_id, offset, chunk_length) in parser.toc:
+                    data = parser.data[offset:offset+chunk_length]
+                    if chunk_id == 2:
+                        entry = [chunk_id, [[mesh_chunk_id] + self.store(index, added, pack_file, mesh_chunk)
+                                            for (mesh_chunk_id, mesh_chunk) in iter_subchunks(data)]]
+                    else:
+                        entry = [chunk_id] + self.store(index, added, pack_file, data)
+                    manifest["chunks"].append(entry)
+                    data.release()
+            # the index only lists bodies already in the pack
+            with io.open(self.index_path, "a") as f:
+                f.write("".join("%s %d %d\n" % (key, offset, length) for (key, offset, length) in added))
+            revisions = self.revisions(name)
+            revision = revisions[-1] + 1 if revisions else 0
+            path = self.manifest_path(name, revision)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            self.replace(path, json.dumps(manifest).encode("utf-8"))
+        return revision
+
+    def store(self, index, added, pack_file, data):
+        """Appends data to the pack unless it is there already. Returns
+        [hash, offset, length] of data in the pack."""
+        key = hashlib.sha256(data).hexdigest()
+        if key not in index:
+            index[key] = [pack_file.tell(), len(data)]
+            added.append([key] + index[key])
+            pack_file.write(data)
+        return [key] + index[key]
+
+    def load_manifest(self, name, revision=None):
+        if revision is None:
+            revisions = self.revisions(name)
+            if not revisions:
+                raise errors.IOError("Error: no revisions of %s" % (name))
+            revision = revisions[-1]
+        try:
+            with io.open(self.manifest_path(name, revision), "r") as f:
+                return json.load(f)
+        except (IOError, OSError):
+            raise errors.IOError("Error: revision %d of %s was not found" % (revision, name))
+
+    def read_chunks(self, ranges):
+        """Returns {(offset, length): body} of the pack ranges, read in
+        pack order"""
+        ranges = sorted(set(ranges))
+        bodies = {}
+        with io.open(self.pack_path, "rb") as pack_file:
+            i = 0
+            while i < len(ranges):
+                # merge the ranges that follow each other in the pack
+                (start, length) = ranges[i]
+                end = start + length
+                j = i + 1
+                while j < len(ranges) and ranges[j][0] <= end:
+                    end = max(end, ranges[j][0] + ranges[j][1])
+                    j += 1
+                pack_file.seek(start)
+                block = pack_file.read(end - start)
+                for (offset, length) in ranges[i:j]:
+                    bodies[(offset, length)] = block[offset - start:offset - start + length]
+                i = j
+        return bodies
+
+    def get(self, name, revision=None):
+        """Returns the level file content of a revision, the latest if
+        revision is None"""
+        manifest = self.load_manifest(name, revision)
+        ranges = []
+        for entry in manifest["chunks"]:
+            if entry[0] == 2:
+                ranges.extend((offset, length) for (mesh_chunk_id, key, offset, length) in entry[1])
+            else:
+                ranges.append((entry[2], entry[3]))
+        bodies = self.read_chunks(ranges)
+        parts = [b"LVL", pack("B", manifest["version"])]
+        for entry in manifest["chunks"]:
+            if entry[0] == 2:
+                subchunks = [pack("II", mesh_chunk_id, length) + bodies[(offset, length)]
+                             for (mesh_chunk_id, key, offset, length) in entry[1]]
+                parts.append(pack("II", 2, sum(len(subchunk) for subchunk in subchunks)))
+                parts.extend(subchunks)
+            else:
+                (chunk_id, key, offset, length) = entry
+                parts.append(pack("II", chunk_id, length))
+                parts.append(bodies[(offset, length)])
+        return b"".join(parts)
+
+    def checkout(self, name, filename, revision=None):
+        """Writes a revision to filename"""
+        self.replace(filename, self.get(name, revision))
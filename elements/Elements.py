@@ -1,7 +1,36 @@
 import ctypes
+import io
 import pprint
-from struct import pack, calcsize
+from struct import pack, calcsize, Struct
 
+# Records of the fixed-size mesh sub-chunk entries
+VERTEX_RECORD = Struct("fffB")
+EDGE_RECORD = Struct("IIB")
+VECTOR_RECORD = Struct("fff")
+TRIANGLE_RECORD = Struct("IIIIII")
+COUNT_RECORD = Struct("I")
+LOOP_EDGE_RECORD = Struct("II")
+FACE_RECORD = Struct("fffffIII")
+MAPPINGGROUP_RECORD = Struct("Iffffffff")
+GEOMETRYGROUP_RECORD = Struct("II")
+
+class Serializable(object):
+
+    """Base for elements written with write(stream).
+
+    dump() collects the same output in memory, so nothing is ever built
+    by repeated bytes concatenation.
+
+    The mesh elements, of which a level has hundreds of thousands, use
+    __slots__ and class-level records instead of per-instance formats.
+    """
+
+    __slots__ = ()
+
+    def dump(self):
+        stream = io.BytesIO()
+        self.write(stream)
+        return stream.getvalue()
 
 class Level(object):
 
@@ -11,7 +40,7 @@ class Level(object):
     def write(self):
         pass
 
-class ChunkHeader(object):
+class ChunkHeader(Serializable):
 
     def __init__(self, version):
         self.magicnumber = "LVL"
@@ -20,20 +49,112 @@ class ChunkHeader(object):
     def get_length(self):
         return 4
 
-    def dump(self):
-        return self.magicnumber.encode("utf-8") + pack("B", self.version)
+    def write(self, stream):
+        stream.write(self.magicnumber.encode("utf-8") + pack("B", self.version))
 
 class Entity(object):
 
     def __init__(self):
         pass
 
-class ChunkEntity(object):
+class ChunkEntity(Serializable):
 
-    def __init__(self):
-        pass
+    """Writes a decoded entity as a version 10 entity chunk.
 
-class ChunkMesh(object):
+    Properties are written with the type, component count and animated
+    flag kept in the property_types of the decoded entity. The type of a
+    property missing there is inferred from its value.
+    """
+
+    def __init__(self, entity):
+        self.id = 1
+        self.entity = entity
+        self.format = "II"
+
+    def get_length(self):
+        return calcsize(self.format) + len(self.dump_body())
+
+    def write(self, stream):
+        body = self.dump_body()
+        stream.write(pack(self.format, self.id, len(body)))
+        stream.write(body)
+
+    def dump_body(self):
+        entity = self.entity
+        parts = []
+        layerdata = entity["layerdata"]
+        if layerdata:
+            bitvalues = layerdata["bitvalues"]
+            parts.append(pack("III", 1, layerdata["format"], len(bitvalues)))
+            parts.append(pack("%dI" % len(bitvalues), *bitvalues))
+        else:
+            parts.append(pack("I", 0))
+        classname = entity["classname"].encode("utf-8")
+        parts.append(pack("II", entity["groupid"], len(classname)))
+        parts.append(classname)
+        properties = entity["properties"]
+        property_types = entity.get("property_types") or {}
+        parts.append(pack("I", len(properties)))
+        for name, value in properties.items():
+            header = property_types.get(name)
+            if header is None:
+                prop = self.dump_property(name, value, entity["is_animated"])
+            else:
+                (prop_type, num_components, is_animated) = header
+                prop = self.dump_typed_property(name, prop_type, value, is_animated, num_components)
+            parts.append(pack("II", 2, len(prop)))
+            parts.append(prop)
+        return b"".join(parts)
+
+    def dump_property(self, name, value, is_animated):
+        return self.dump_typed_property(name, self.property_type(value), value, is_animated)
+
+    def property_type(self, value):
+        if isinstance(value, bool):
+            return 1
+        elif isinstance(value, int):
+            return 3
+        elif isinstance(value, str):
+            return 0
+        elif isinstance(value, float):
+            return 2
+        elif isinstance(value, dict) and "red" in value:
+            return 5
+        elif isinstance(value, dict):
+            return 7
+        return 6
+
+    def dump_typed_property(self, name, prop_type, value, is_animated, num_components=None):
+        """Encodes a property chunk body with the given property type.
+        num_components, if given, is written for the single value types
+        and tells a three component color from one with alpha."""
+        encoded = name.encode("utf-8")
+        data = pack("I", len(encoded)) + encoded
+        if prop_type in (0, 4):
+            value = value.encode("utf-16-le")
+            data += pack("IIII", prop_type, num_components or 1, int(is_animated), len(value) // 2)
+            data += value
+        elif prop_type == 1:
+            data += pack("IIII", 1, num_components or 1, int(is_animated), int(value))
+        elif prop_type in (3, 10):
+            data += pack("IIIi", prop_type, num_components or 1, int(is_animated), value)
+        elif prop_type == 5:
+            components = (value["red"], value["green"], value["blue"], value["alpha"])
+            if num_components == 3:
+                components = components[:3]
+            data += pack("III", 5, len(components), int(is_animated))
+            data += pack("%df" % len(components), *components)
+        elif prop_type == 7:
+            components = [value[key] for key in ("roll", "pitch", "yaw") if key in value]
+            data += pack("III", 7, len(components), int(is_animated))
+            data += pack("%df" % len(components), *components)
+        else:
+            components = tuple(value) if isinstance(value, (tuple, list)) else (value,)
+            data += pack("III", prop_type, len(components), int(is_animated))
+            data += pack("%df" % len(components), *components)
+        return data
+
+class ChunkMesh(Serializable):
 
     def __init__(self, vertices=(), edges=(), faces=(), materials=(), facelayers=(), mappinggroups={},
                        geometrygroups=(), triangles={}, smoothednormals=(), ghostvertices=(),
@@ -52,25 +173,21 @@ class ChunkMesh(object):
         self.format = "II"
 
     def get_length(self):
-        length = 0
-        for chunk in self.chunks:
-            if not chunk.empty():
-                length += chunk.get_length()
-        if length > 0:
-            length += calcsize(self.format)
-        return length
+        return sum(self.get_chunk_lengths(), calcsize(self.format))
 
-    def dump(self):
-        data = b""
-        if self.get_length() > 0:
-            chunk_length = self.get_length() - 8
-            data += pack(self.format, self.id, chunk_length)
-            for chunk in self.chunks:
-                if not chunk.empty():
-                    data += chunk.dump()
-        return data
+    def get_chunk_lengths(self):
+        return [chunk.get_length() for chunk in self.chunks if not chunk.empty()]
+
+    def write(self, stream):
+        # sizes are computed once and handed down to the sub-chunks
+        chunks = [chunk for chunk in self.chunks if not chunk.empty()]
+        lengths = self.get_chunk_lengths()
+        if chunks:
+            stream.write(pack(self.format, self.id, sum(lengths)))
+            for chunk, length in zip(chunks, lengths):
+                chunk.write(stream, length)
 
-class ChunkGeometrygroups(object):
+class ChunkGeometrygroups(Serializable):
 
     def __init__(self, vertexgroups, edgegroups, facegroups):
         self.id = 8
@@ -91,28 +208,16 @@ class ChunkGeometrygroups(object):
             length += group.get_length()
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        num_vertexgroups = len(self.vertexgroups)
-        num_edgegroups = len(self.edgegroups)
-        num_facegroups = len(self.facegroups)
-        data = pack("II", self.id, chunk_length)
-
-        data += pack("I", num_vertexgroups)
-        for group in self.vertexgroups:
-            data += group.dump()
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack("II", self.id, length - 8))
+        for groups in (self.vertexgroups, self.edgegroups, self.facegroups):
+            stream.write(pack("I", len(groups)))
+            for group in groups:
+                group.write(stream)
 
-        data += pack("I", num_edgegroups)
-        for group in self.edgegroups:
-            data += group.dump()
-
-        data += pack("I", num_facegroups)
-        for group in self.facegroups:
-            data += group.dump()
-
-        return data
-
-class ChunkLayers(object):
+class ChunkLayers(Serializable):
 
     def __init__(self, layers):
         self.id = 3
@@ -120,7 +225,7 @@ class ChunkLayers(object):
         self.format = "III"
 
     def empty(self):
-        return not self.layers > 0
+        return not self.layers
 
     def get_length(self):
         length = calcsize(self.format)
@@ -128,37 +233,69 @@ class ChunkLayers(object):
             length += layer.get_length()
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        data = pack(self.format, self.id, chunk_length, len(self.layers))
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.layers)))
         for layer in self.layers:
-            data += layer.dump()
-        return data
+            layer.write(stream)
 
-class ChunkGroups(object):
+class ChunkGroups(ChunkLayers):
 
     def __init__(self, groups):
+        super(ChunkGroups, self).__init__(groups)
         self.id = 5
         self.groups = groups
+
+class ChunkViewport(Serializable):
+
+    def __init__(self, viewport_xml):
+        self.id = 4
+        self.viewport_xml = viewport_xml
         self.format = "III"
 
-    def empty(self):
-        return not self.groups > 0
+    def get_length(self):
+        return calcsize(self.format) + len(self.viewport_xml.encode("utf-16-le"))
+
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        encoded = self.viewport_xml.encode("utf-16-le")
+        stream.write(pack(self.format, self.id, length - 8, len(encoded) // 2))
+        stream.write(encoded)
+
+class ChunkCustomColors(Serializable):
+
+    def __init__(self, customcolors):
+        self.id = 6
+        self.customcolors = customcolors
+        self.format = "III"
 
     def get_length(self):
-        length = calcsize(self.format)
-        for group in self.groups:
-            length += group.get_length()
-        return length
+        return calcsize(self.format) + 4 * len(self.customcolors)
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        data = pack(self.format, self.id, chunk_length, len(self.groups))
-        for group in self.groups:
-            data += group.dump()
-        return data
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.customcolors)))
+        for color in self.customcolors:
+            stream.write(pack("BBBB", color["red"], color["green"], color["blue"], color["alpha"]))
+
+class ChunkEditorSettings(Serializable):
+
+    def __init__(self, data):
+        self.id = 7
+        self.data = data
+        self.format = "II"
 
-class ChunkMappinggroups(object):
+    def get_length(self):
+        return calcsize(self.format) + len(self.data)
+
+    def write(self, stream, length=None):
+        stream.write(pack(self.format, self.id, len(self.data)))
+        stream.write(self.data)
+
+class ChunkMappinggroups(Serializable):
 
     def __init__(self, mappinggroups):
         self.id = 7
@@ -174,15 +311,14 @@ class ChunkMappinggroups(object):
             length += group.get_length()
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        num_mappinggroups = 0
-        data = pack(self.format, self.id, chunk_length, num_mappinggroups)
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.mappinggroups)))
         for group in self.mappinggroups:
-            data += group.dump()
-        return data
+            group.write(stream)
 
-class ChunkFacelayers(object):
+class ChunkFacelayers(Serializable):
 
     def __init__(self, facelayers):
         self.id = 6
@@ -198,16 +334,16 @@ class ChunkFacelayers(object):
             length += facelayer.get_length()
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
         num_facelayers = len(self.facelayers)
         format = 2
-        data = pack(self.format, self.id, chunk_length, num_facelayers, format)
+        stream.write(pack(self.format, self.id, length - 8, num_facelayers, format))
         for facelayer in self.facelayers:
-            data += facelayer.dump()
-        return data
+            facelayer.write(stream)
 
-class ChunkFaces(object):
+class ChunkFaces(Serializable):
 
     def __init__(self, faces):
         self.id = 3
@@ -223,14 +359,14 @@ class ChunkFaces(object):
             length += face.get_length()
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        bytes = pack(self.format, self.id, chunk_length, len(self.faces))
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.faces)))
         for face in self.faces:
-            bytes += face.dump()
-        return bytes
+            face.write(stream)
 
-class ChunkEdges(object):
+class ChunkEdges(Serializable):
 
     def __init__(self, edges):
         self.id = 2
@@ -241,19 +377,16 @@ class ChunkEdges(object):
         return not self.edges
 
     def get_length(self):
-        length = calcsize(self.format)
-        for edge in self.edges:
-            length += edge.get_length()
-        return length
+        return calcsize(self.format) + EDGE_RECORD.size * len(self.edges)
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        bytes = pack(self.format, self.id, chunk_length, len(self.edges))
-        for edge in self.edges:
-            bytes += edge.dump()
-        return bytes
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.edges)))
+        pack_edge = EDGE_RECORD.pack
+        stream.write(b"".join([pack_edge(edge.v1.id, edge.v2.id, edge.smooth) for edge in self.edges]))
 
-class ChunkVertices(object):
+class ChunkVertices(Serializable):
 
     def __init__(self, vertices):
         self.id = 1
@@ -264,19 +397,17 @@ class ChunkVertices(object):
         return not self.vertices
 
     def get_length(self):
-        length = calcsize(self.format)
-        for vertex in self.vertices:
-            length += vertex.get_length()
-        return length
+        return calcsize(self.format) + VERTEX_RECORD.size * len(self.vertices)
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        bytes = pack(self.format, self.id, chunk_length, len(self.vertices))
-        for vertex in self.vertices:
-            bytes += vertex.dump()
-        return bytes
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.vertices)))
+        pack_vertex = VERTEX_RECORD.pack
+        stream.write(b"".join([pack_vertex(vertex.x, vertex.y, vertex.z, vertex.smoothing)
+                               for vertex in self.vertices]))
 
-class ChunkTriangles(object):
+class ChunkTriangles(Serializable):
 
     def __init__(self, ghostvertices, smoothednormals, triangles):
         self.id = 5
@@ -293,33 +424,32 @@ class ChunkTriangles(object):
 
     def get_length(self):
         length = 6*4
-        for vertex in self.ghostvertices:
-            length += vertex.get_length()
-        for vector in self.smoothednormals:
-            length += vector.get_length()
+        length += VECTOR_RECORD.size * (len(self.ghostvertices) + len(self.smoothednormals))
         for face_triangles in self.faces:
-            length += 4
-            for triangle in face_triangles:
-                length += triangle.get_length()
+            length += COUNT_RECORD.size + TRIANGLE_RECORD.size * len(face_triangles)
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        bytes = pack("II", self.id, chunk_length)
-        bytes += pack("I", len(self.ghostvertices))
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack("II", self.id, length - 8))
+        stream.write(pack("I", len(self.ghostvertices)))
         for vertex in self.ghostvertices:
-            bytes += vertex.dump()
-        bytes += pack("I", len(self.smoothednormals))
+            vertex.write(stream)
+        stream.write(pack("I", len(self.smoothednormals)))
         for vector in self.smoothednormals:
-            bytes += vector.dump()
-        bytes += pack("II", len(self.faces), self.total)
+            vector.write(stream)
+        stream.write(pack("II", len(self.faces), self.total))
+        pack_count = COUNT_RECORD.pack
+        pack_triangle = TRIANGLE_RECORD.pack
+        records = []
         for face_triangles in self.faces:
-            bytes += pack("I", len(face_triangles))
-            for triangle in face_triangles:
-                bytes += triangle.dump()
-        return bytes
+            records.append(pack_count(len(face_triangles)))
+            for t in face_triangles:
+                records.append(pack_triangle(t.v1.id, t.v2.id, t.v3.id, t.n1.id, t.n2.id, t.n3.id))
+        stream.write(b"".join(records))
 
-class ChunkMaterials(object):
+class ChunkMaterials(Serializable):
 
     def __init__(self, materials):
         self.id = 4
@@ -332,61 +462,63 @@ class ChunkMaterials(object):
     def get_length(self):
         length = calcsize(self.format)
         for material in self.materials:
-            length += 4 + len(material)
+            length += 4 + len(material.encode("utf-8"))
         return length
 
-    def dump(self):
-        chunk_length = self.get_length() - 8
-        data = b""
-        data += pack(self.format, self.id, chunk_length, len(self.materials))
+    def write(self, stream, length=None):
+        if length is None:
+            length = self.get_length()
+        stream.write(pack(self.format, self.id, length - 8, len(self.materials)))
         for material in self.materials:
-            data += pack("I", len(material))
             encoded = material.encode("utf-8")
-            data += encoded
-        return data
+            stream.write(pack("I", len(encoded)))
+            stream.write(encoded)
+
+class Vector(Serializable):
 
-class Vector(object):
+    __slots__ = ("id", "x", "y", "z")
+    record = VECTOR_RECORD
 
     def __init__(self, id=0, x=0.0, y=0.0, z=0.0):
         self.id = id
         self.x = x
         self.y = y
         self.z = z
-        self.format = "fff"
 
     def get_length(self):
-        return calcsize(self.format)
+        return self.record.size
 
-    def dump(self):
-        return pack(self.format, self.x, self.y, self.z)
+    def write(self, stream):
+        stream.write(VECTOR_RECORD.pack(self.x, self.y, self.z))
 
 class Vertex(Vector):
 
+    __slots__ = ("smoothing",)
+    record = VERTEX_RECORD
+
     def __init__(self, id, x=0.0, y=0.0, z=0.0, smoothing=False):
         super(Vertex, self).__init__(id, x, y, z)
         self.smoothing = smoothing
-        self.format = "fffB"
 
-    def get_length(self):
-        return calcsize(self.format)
+    def write(self, stream):
+        stream.write(VERTEX_RECORD.pack(self.x, self.y, self.z, int(self.smoothing)))
 
-    def dump(self):
-        return pack(self.format, self.x, self.y, self.z, int(self.smoothing))
+class Edge(Serializable):
 
-class Edge(object):
+    __slots__ = ("id", "v1", "v2", "smooth")
+    record = EDGE_RECORD
 
     def __init__(self, id, v1, v2, smooth=False):
         self.id = id
         self.v1 = v1
         self.v2 = v2
         self.smooth = smooth
-        self.format = "IIB"
 
     def get_length(self):
-        return calcsize(self.format)
+        return self.record.size
 
-    def dump(self):
-        return pack(self.format, self.v1.id, self.v2.id, int(self.smooth))
+    def write(self, stream):
+        stream.write(EDGE_RECORD.pack(self.v1.id, self.v2.id, int(self.smooth)))
 
 class Group(object):
 
@@ -402,48 +534,46 @@ class Group(object):
     def dump(self):
         pass
 
-class EdgeLoop(object):
+class EdgeLoop(Serializable):
+
+    __slots__ = ("edges",)
 
     def __init__(self, edges):
         self.edges = edges
-        self.format = "I"
 
     def get_length(self):
-        length = calcsize(self.format)
-        for edge in self.edges:
-            length += calcsize("II")
-        return length
+        return COUNT_RECORD.size + len(self.edges) * LOOP_EDGE_RECORD.size
 
-    def dump(self):
-        data = pack(self.format, len(self.edges))
-        for edge in self.edges:
-            data += pack("II", int(edge["is_flipped"]), edge["edge"].id)
-        return data
+    def write(self, stream):
+        pack_edge = LOOP_EDGE_RECORD.pack
+        stream.write(COUNT_RECORD.pack(len(self.edges)) +
+                     b"".join([pack_edge(int(edge["is_flipped"]), edge["edge"].id) for edge in self.edges]))
+
+class Face(Serializable):
 
-class Face(object):
+    __slots__ = ("id", "scale", "offset", "angle", "border_edgeloop", "edgeloops", "mapping_group", "material")
+    record = FACE_RECORD
 
     def __init__(self, id, border_edgeloop, material, scale=(1.0, 1.0),
-                 offset=(0.0, 0.0), angle=0.0, mapping_group=4294967295):
+                 offset=(0.0, 0.0), angle=0.0, mapping_group=4294967295, edgeloops=()):
         self.id = id
         self.scale = scale
         self.offset = offset
         self.angle = angle
         self.border_edgeloop = border_edgeloop
-        self.edgeloops = []
+        self.edgeloops = list(edgeloops)
         self.mapping_group = mapping_group
         self.material = material
-        self.format = "fffffIII"
 
     def get_length(self):
-        length = calcsize(self.format)
+        length = self.record.size
         length += self.border_edgeloop.get_length()
         for edgeloop in self.edgeloops:
             length += edgeloop.get_length()
         return length
 
-    def dump(self):
-        data = pack(
-            self.format,
+    def write(self, stream):
+        stream.write(FACE_RECORD.pack(
             self.angle,
             self.offset[0],
             self.offset[1],
@@ -452,13 +582,15 @@ class Face(object):
             self.mapping_group,
             self.material,
             len(self.edgeloops)
-        )
-        data += self.border_edgeloop.dump()
+        ))
+        self.border_edgeloop.write(stream)
         for edgeloop in self.edgeloops:
-            data += edgeloop.dump()
-        return data
+            edgeloop.write(stream)
 
-class Triangle(object):
+class Triangle(Serializable):
+
+    __slots__ = ("v1", "v2", "v3", "n1", "n2", "n3")
+    record = TRIANGLE_RECORD
 
     def __init__(self, v1, v2, v3, n1=Vector(), n2=Vector(), n3=Vector()):
         self.v1 = v1
@@ -467,16 +599,16 @@ class Triangle(object):
         self.n1 = n1
         self.n2 = n2
         self.n3 = n3
-        self.format = "IIIIII"
 
     def get_length(self):
-        return calcsize(self.format)
+        return self.record.size
 
-    def dump(self):
-        data = pack(self.format, self.v1.id, self.v2.id, self.v3.id, self.n1.id, self.n2.id, self.n3.id)
-        return data
+    def write(self, stream):
+        stream.write(TRIANGLE_RECORD.pack(self.v1.id, self.v2.id, self.v3.id, self.n1.id, self.n2.id, self.n3.id))
 
-class Facelayer(object):
+class Facelayer(Serializable):
+
+    __slots__ = ("bitvalues", "has_layers")
 
     def __init__(self, bitvalues):
         self.bitvalues = bitvalues
@@ -488,20 +620,20 @@ class Facelayer(object):
     def get_length(self):
         length = 4
         if self.has_layers:
-            length += 4
-        for bitvalue in self.bitvalues:
-            length += 4
+            length += 4 + 4 * len(self.bitvalues)
         return length
 
-    def dump(self):
-        data = pack("I", int(self.has_layers))
+    def write(self, stream):
         if self.has_layers:
-            data += pack("I", len(self.bitvalues))
-            for bitvalue in self.bitvalues:
-                data += pack("I", bitvalue)
-        return data
+            stream.write(pack("II", 1, len(self.bitvalues)))
+            stream.write(pack("%dI" % len(self.bitvalues), *self.bitvalues))
+        else:
+            stream.write(pack("I", 0))
+
+class Mappinggroup(Serializable):
 
-class Mappinggroup(object):
+    __slots__ = ("id", "angle", "scale", "offset", "normal")
+    record = MAPPINGGROUP_RECORD
 
     def __init__(self, gid, angle, scale, offset, normal):
         self.id = gid
@@ -509,35 +641,32 @@ class Mappinggroup(object):
         self.scale = scale
         self.offset = offset
         self.normal = normal
-        self.format = "Ifffffff"
 
     def get_length(self):
-        return calcsize(self.format)
+        return self.record.size
 
-    def dump(self):
-        return pack(self.format, self.gid, self.angle, self.scale[0], self.scale[1],
-                    self.offset[0], self.offset[1], self.normal[0], self.normal[1])
+    def write(self, stream):
+        stream.write(MAPPINGGROUP_RECORD.pack(self.id, self.angle, self.scale[0], self.scale[1],
+                          self.offset[0], self.offset[1], self.normal[0], self.normal[1], self.normal[2]))
+
+class Geometrygroup(Serializable):
 
-class Geometrygroup(object):
+    __slots__ = ("gid", "indices")
 
     def __init__(self, gid, indices):
         self.gid = gid
         self.indices = indices
-        self.format = "II"
 
     def get_length(self):
-        length = calcsize(self.format)
-        for index in self.indices:
-            length += 4
-        return length
+        return GEOMETRYGROUP_RECORD.size + 4 * len(self.indices)
 
-    def dump(self):
-        data = pack(self.format, self.gid, len(self.indices))
-        for index in self.indices:
-            data += pack("I", index)
-        return data
+    def write(self, stream):
+        stream.write(GEOMETRYGROUP_RECORD.pack(self.gid, len(self.indices)))
+        stream.write(pack("%dI" % len(self.indices), *self.indices))
+
+class Layer(Serializable):
 
-class Layer(object):
+    __slots__ = ("id", "name", "visible", "color")
 
     def __init__(self, id, name, visible, color):
         self.id = id
@@ -546,17 +675,18 @@ class Layer(object):
         self.color = color
 
     def get_length(self):
-        length = calcsize("IIIIIII")
-        length += len(self.name)
+        length = calcsize("IIBBBBI")
+        length += len(self.name.encode("utf-16-le"))
         return length
 
-    def dump(self):
-        data = pack("I", int(len(self.name.encode("utf-8"))/2))
-        data += self.name.encode("utf-8")
-        data += pack("I", int(self.visible))
-        data += pack("IIII", self.color["red"], self.color["green"], self.color["blue"], self.color["alpha"])
-        data += pack("I", self.id)
-        return data
+    def write(self, stream):
+        encoded = self.name.encode("utf-16-le")
+        stream.write(pack("I", len(encoded) // 2))
+        stream.write(encoded)
+        stream.write(pack("I", int(self.visible)))
+        stream.write(pack("BBBB", self.color["red"], self.color["green"], self.color["blue"], self.color["alpha"]))
+        stream.write(pack("I", self.id))
 
 class Group(Layer):
-    pass
\ No newline at end of file
+
+    __slots__ = ()
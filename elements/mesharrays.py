@@ -0,0 +1,259 @@
+from struct import pack
+import numpy as np
+
+from elements.Elements import Serializable
+from parsers import meshrecords
+
+# kinds of geometry groups, in their order in the geometry group chunk
+GROUP_KINDS = ("vertex", "edge", "face")
+
+
+class MeshArrays(object):
+
+    """Level mesh stored column-wise in flat typed arrays.
+
+    Vertices, edges, faces and triangles are held as one array per
+    attribute instead of one dict or object per element. Edge loops refer
+    to edges by index, edges and triangles refer to vertices by index.
+    """
+
+    def __init__(self):
+        self.materials = []
+
+        # vertices
+        self.positions = np.empty((0, 3), np.float32)
+        self.vertex_smoothing = np.empty(0, bool)
+
+        # edges
+        self.edges = np.empty((0, 2), np.uint32)
+        self.edge_smooth = np.empty(0, bool)
+
+        # faces, the edge loops of face i are loops face_loop_offsets[i] up
+        # to face_loop_offsets[i + 1] with the border loop first, and the
+        # (edge_index, is_flipped) rows of loop j are loop_edges rows
+        # loop_edge_offsets[j] up to loop_edge_offsets[j + 1]
+        self.face_angles = np.empty(0, np.float32)
+        self.face_offsets = np.empty((0, 2), np.float32)
+        self.face_scales = np.empty((0, 2), np.float32)
+        self.face_mapping_groups = np.empty(0, np.uint32)
+        self.face_materials = np.empty(0, np.uint32)
+        self.face_loop_offsets = np.zeros(1, np.int64)
+        self.loop_edge_offsets = np.zeros(1, np.int64)
+        self.loop_edges = np.empty((0, 2), np.uint32)
+
+        # triangles, one (vi_1, vi_2, vi_3, sni_1, sni_2, sni_3) row each,
+        # the triangles of face i are rows face_triangle_offsets[i] up to
+        # face_triangle_offsets[i + 1]
+        self.ghost_vertices = np.empty((0, 3), np.float32)
+        self.smoothed_normals = np.empty((0, 3), np.float32)
+        self.triangles = np.empty((0, 6), np.uint32)
+        self.face_triangle_offsets = np.zeros(1, np.int64)
+        self.num_triangles = 0
+
+        # face layers, bit n of face_layer_bits[i] is set if face i is on
+        # layer n, face_layer_counts[i] is the number of bit value words
+        # stored for face i, 0 for faces without layer data
+        self.face_layer_counts = np.empty(0, np.uint32)
+        self.face_layer_bits = np.empty((0, 0), np.uint32)
+
+        self.mapping_groups = {}
+
+        # geometry groups, the members in file order of vertex group
+        # vertex_group_ids[i] are vertex_group_indices[j:k] with j, k =
+        # vertex_group_offsets[i:i + 2], the same for edge and face groups
+        for kind in GROUP_KINDS:
+            setattr(self, kind + "_group_ids", np.empty(0, np.uint32))
+            setattr(self, kind + "_group_offsets", np.zeros(1, np.int64))
+            setattr(self, kind + "_group_indices", np.empty(0, np.uint32))
+
+    def num_vertices(self):
+        return len(self.positions)
+
+    def num_edges(self):
+        return len(self.edges)
+
+    def num_faces(self):
+        return len(self.face_angles)
+
+    def num_edgeloops(self):
+        return len(self.loop_edge_offsets) - 1
+
+    def face_edges(self, i):
+        """Returns the (edge_index, is_flipped) rows of all edge loops of
+        face i, border loop first"""
+        loop_offsets = self.face_loop_offsets
+        return self.loop_edges[self.loop_edge_offsets[loop_offsets[i]]:self.loop_edge_offsets[loop_offsets[i + 1]]]
+
+    def edgeloop(self, j):
+        return self.loop_edges[self.loop_edge_offsets[j]:self.loop_edge_offsets[j + 1]]
+
+    def border_edgeloop(self, i):
+        return self.edgeloop(self.face_loop_offsets[i])
+
+    def face_edgeloops(self, i):
+        return [self.edgeloop(j) for j in range(self.face_loop_offsets[i], self.face_loop_offsets[i + 1])]
+
+    def face_triangles(self, i):
+        return self.triangles[self.face_triangle_offsets[i]:self.face_triangle_offsets[i + 1]]
+
+    def triangle_faces(self):
+        """Returns the face index of every triangle"""
+        return np.repeat(np.arange(len(self.face_triangle_offsets) - 1), np.diff(self.face_triangle_offsets))
+
+    def vertex_indices(self):
+        """Returns the (N, 3) vertex index buffer of the triangles"""
+        return self.triangles[:, :3]
+
+    def normal_indices(self):
+        """Returns the (N, 3) smoothed normal index buffer of the triangles"""
+        return self.triangles[:, 3:]
+
+    def group_members(self, kind, gid):
+        """Returns the indices in the kind ("vertex", "edge" or "face")
+        group gid, in file order"""
+        ids = getattr(self, kind + "_group_ids")
+        offsets = getattr(self, kind + "_group_offsets")
+        found = np.flatnonzero(ids == gid)
+        if not len(found):
+            return np.empty(0, np.uint32)
+        return getattr(self, kind + "_group_indices")[offsets[found[0]]:offsets[found[0] + 1]]
+
+    def groups_containing(self, kind, index):
+        """Returns the ids of the kind groups that contain index"""
+        offsets = getattr(self, kind + "_group_offsets")
+        positions = np.flatnonzero(getattr(self, kind + "_group_indices") == index)
+        return getattr(self, kind + "_group_ids")[np.searchsorted(offsets, positions, "right") - 1]
+
+    def faces_in_group(self, gid):
+        return self.group_members("face", gid)
+
+    def layer_mask(self, layer_ids):
+        """Returns the face_layer_bits row with the bits of layer_ids set"""
+        mask = np.zeros(self.face_layer_bits.shape[1], np.uint32)
+        for layer_id in layer_ids:
+            if layer_id // 32 < len(mask):
+                mask[layer_id // 32] |= np.uint32(1 << (layer_id % 32))
+        return mask
+
+    def faces_in_layers(self, layer_ids):
+        """Returns the indices of the faces on any of the layers layer_ids.
+        Faces without layer data are on no layer."""
+        return np.flatnonzero((self.face_layer_bits & self.layer_mask(layer_ids)).any(axis=1))
+
+    def face_layer_ids(self, i):
+        bits = np.unpackbits(self.face_layer_bits[i].astype("<u4").view(np.uint8), bitorder="little")
+        return np.flatnonzero(bits)
+
+    def nbytes(self):
+        length = 0
+        for value in self.__dict__.values():
+            if isinstance(value, np.ndarray):
+                length += value.nbytes
+        return length
+
+
+class ChunkMeshArrays(Serializable):
+
+    """Writes a MeshArrays as a mesh chunk.
+
+    Sub-chunks are written in the same order and with the same empty-chunk
+    rules as ChunkMesh. Each sub-chunk is a list of encoded parts, written
+    one after the other without being joined. The parts are encoded once,
+    by the first get_length() or write(), and dropped after write().
+    """
+
+    def __init__(self, mesh):
+        self.id = 2
+        self.mesh = mesh
+        self.parts = None
+
+    def get_length(self):
+        return 8 + sum(len(part) for part in self.dump_parts())
+
+    def dump_parts(self):
+        if self.parts is None:
+            self.parts = [part for chunk in (self.dump_materials(), self.dump_vertices(), self.dump_edges(),
+                                             self.dump_faces(), self.dump_facelayers(), self.dump_mappinggroups(),
+                                             self.dump_geometrygroups(), self.dump_triangles())
+                          for part in chunk]
+        return self.parts
+
+    def write(self, stream):
+        parts = self.dump_parts()
+        stream.write(pack("II", self.id, sum(len(part) for part in parts)))
+        for part in parts:
+            stream.write(part)
+        self.parts = None
+
+    def dump_chunk(self, chunk_id, parts):
+        return [pack("II", chunk_id, sum(len(part) for part in parts))] + parts
+
+    def dump_materials(self):
+        materials = self.mesh.materials
+        if not materials:
+            return []
+        parts = [pack("I", len(materials))]
+        for material in materials:
+            encoded = material.encode("utf-8")
+            parts.append(pack("I", len(encoded)))
+            parts.append(encoded)
+        return self.dump_chunk(4, parts)
+
+    def dump_vertices(self):
+        mesh = self.mesh
+        if not len(mesh.positions):
+            return []
+        parts = [pack("I", len(mesh.positions)),
+                 meshrecords.vertex_records(mesh.positions, mesh.vertex_smoothing)]
+        return self.dump_chunk(1, parts)
+
+    def dump_edges(self):
+        mesh = self.mesh
+        if not len(mesh.edges):
+            return []
+        parts = [pack("I", len(mesh.edges)), meshrecords.edge_records(mesh.edges, mesh.edge_smooth)]
+        return self.dump_chunk(2, parts)
+
+    def dump_faces(self):
+        mesh = self.mesh
+        if not mesh.num_faces():
+            return []
+        parts = [pack("I", mesh.num_faces()),
+                 meshrecords.face_records(mesh.face_angles, mesh.face_offsets, mesh.face_scales,
+                                          mesh.face_mapping_groups, mesh.face_materials, mesh.face_loop_offsets,
+                                          mesh.loop_edge_offsets, mesh.loop_edges)]
+        return self.dump_chunk(3, parts)
+
+    def dump_facelayers(self):
+        mesh = self.mesh
+        parts = [pack("II", len(mesh.face_layer_counts), 2),
+                 meshrecords.facelayer_records(mesh.face_layer_counts, mesh.face_layer_bits)]
+        return self.dump_chunk(6, parts)
+
+    def dump_mappinggroups(self):
+        mappinggroups = self.mesh.mapping_groups
+        parts = [pack("I", len(mappinggroups))]
+        for mgid, group in mappinggroups.items():
+            parts.append(pack("Iffffffff", mgid, group["angle"], group["scale"][0], group["scale"][1],
+                              group["offset"][0], group["offset"][1], *group["normal"]))
+        return self.dump_chunk(7, parts)
+
+    def dump_geometrygroups(self):
+        mesh = self.mesh
+        parts = []
+        for kind in GROUP_KINDS:
+            parts.append(meshrecords.geometrygroup_records(getattr(mesh, kind + "_group_ids"),
+                                                           getattr(mesh, kind + "_group_offsets"),
+                                                           getattr(mesh, kind + "_group_indices")))
+        return self.dump_chunk(8, parts)
+
+    def dump_triangles(self):
+        mesh = self.mesh
+        num_faces = len(mesh.face_triangle_offsets) - 1
+        if not (len(mesh.ghost_vertices) or len(mesh.smoothed_normals) or num_faces):
+            return []
+        parts = [pack("I", len(mesh.ghost_vertices)), mesh.ghost_vertices.astype("<f4").tobytes(),
+                 pack("I", len(mesh.smoothed_normals)), mesh.smoothed_normals.astype("<f4").tobytes(),
+                 pack("II", num_faces, mesh.num_triangles)]
+        parts.append(meshrecords.triangle_records(mesh.triangles, mesh.face_triangle_offsets))
+        return self.dump_chunk(5, parts)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import operator
+
+import errors
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values
+}
+
+
+# positions of the set bits of every byte value
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def bit_rows(bits):
+    """Yields the row numbers of the set bits of a row bitmap, in order"""
+    # walk the bytes, shifting or masking the whole int would copy it per row
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for (index, byte) in enumerate(data):
+        if byte:
+            base = 8 * index
+            for bit in BYTE_BITS[byte]:
+                yield base + bit
+
+
+def rows_bitmap(rows, size):
+    """Returns the bitmap of a list of row numbers below size"""
+    data = bytearray((size + 7) // 8)
+    for row in rows:
+        data[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(data, "little")
+
+
+class EntityTable(object):
+
+    """Indexed view of the decoded entities of a level.
+
+    Row sets are Python ints used as bitmaps, bit i standing for
+    entities[i]. Classnames and group ids are hashed to the bitmap of
+    their rows and every layer id has the bitmap of the entities on it, so
+    select() combines indexes with a few integer operations and only
+    evaluates property predicates on the rows that are left. Bitmaps are
+    built once from lists of row numbers, never bit by bit.
+    """
+
+    def __init__(self, entities):
+        self.entities = list(entities)
+        self.all_rows = (1 << len(self.entities)) - 1
+        classnames = {}
+        groupids = {}
+        layers = {}
+        for row, entity in enumerate(self.entities):
+            classnames.setdefault(entity["classname"], []).append(row)
+            groupids.setdefault(entity["groupid"], []).append(row)
+            layerdata = entity["layerdata"]
+            if layerdata:
+                for word, bitmask in enumerate(layerdata["bitvalues"]):
+                    for layer_bit in bit_rows(bitmask):
+                        layers.setdefault(32 * word + layer_bit, []).append(row)
+        self.classnames = self.index(classnames)
+        self.groupids = self.index(groupids)
+        self.layers = self.index(layers)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def index(self, rows):
+        return dict((key, rows_bitmap(key_rows, len(self.entities))) for key, key_rows in rows.items())
+
+    def index_rows(self, index, keys):
+        if isinstance(keys, (str, int)):
+            keys = (keys,)
+        rows = 0
+        for key in keys:
+            rows |= index.get(key, 0)
+        return rows
+
+    def rows(self, classname=None, groupid=None, layers=None, where=()):
+        """Returns the bitmap of the rows matching all of the given filters.
+
+        classname and groupid take a value or a list of values, layers a
+        list of layer ids of which an entity must be on any. where is a
+        list of (property name, operator, value) predicates, the operators
+        being those of OPERATORS and "exists".
+        """
+        rows = self.all_rows
+        if classname is not None:
+            rows &= self.index_rows(self.classnames, classname)
+        if groupid is not None:
+            rows &= self.index_rows(self.groupids, groupid)
+        if layers is not None:
+            rows &= self.index_rows(self.layers, layers)
+        for (name, op, value) in where:
+            if op == "exists":
+                test = lambda properties: (name in properties) == bool(value)
+            elif op in OPERATORS:
+                compare = OPERATORS[op]
+                test = lambda properties: name in properties and compare(properties[name], value)
+            else:
+                raise errors.TypeError("Error: unknown operator: %s" % (op))
+            matching = []
+            for row in bit_rows(rows):
+                try:
+                    if test(self.entities[row]["properties"]):
+                        matching.append(row)
+                except TypeError:
+                    # values of other types never match
+                    pass
+            rows = rows_bitmap(matching, len(self.entities))
+        return rows
+
+    def select(self, classname=None, groupid=None, layers=None, where=()):
+        """Returns the matching entities in level order, see rows()"""
+        return [self.entities[row] for row in bit_rows(self.rows(classname, groupid, layers, where))]
+
+    def count(self, classname=None, groupid=None, layers=None, where=()):
+        return bin(self.rows(classname, groupid, layers, where)).count("1")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import marshal
+import os
+
+import numpy as np
+
+from elements.mesharrays import MeshArrays
+from parsers.levelparser import LevelParser
+
+# Bump when the decoded form of a level changes, so old entries are not used
+CACHE_VERSION = 8
+DEFAULT_MAX_SIZE = 1 << 30
+
+
+class CachedLevel(object):
+
+    """Decoded level with the getters of LevelParser"""
+
+    def __init__(self, version, elements):
+        self.version = version
+        self.elements = elements
+
+    def get_entities(self):
+        return self.elements[1]
+
+    def get_mesh(self):
+        return self.elements[2]
+
+    def get_layers(self):
+        return self.elements[3]
+
+    def get_viewport(self):
+        return self.elements[4]
+
+    def get_groups(self):
+        return self.elements[5]
+
+    def get_customcolors(self):
+        return self.elements[6]
+
+    def get_editorsettings(self):
+        return self.elements[7]
+
+
+class LevelCache(object):
+
+    """On-disk cache of decoded levels.
+
+    Entries are keyed by a hash of the level file content. The last seen
+    size and mtime of each file are kept in an index so that unchanged
+    files are looked up without hashing them again. Each entry is a .npz
+    with the mesh arrays and a marshal blob with the entities and the
+    remaining chunks. Once the entries exceed max_size bytes, the least
+    recently used ones are removed along with their index entries.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.index_path = os.path.join(directory, "index.json")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def parse(self, filename):
+        """Returns the decoded level, from the cache if possible"""
+        key = self.key(filename)
+        level = self.load(key)
+        if level is None:
+            with LevelParser(filename, use_mmap=True, vectorized=True) as parser:
+                parser.parse()
+                level = CachedLevel(parser.version, parser.elements)
+            self.store(key, level)
+        return level
+
+    def key(self, filename):
+        stat = os.stat(filename)
+        path = os.path.abspath(filename)
+        index = self.read_index()
+        entry = index.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return entry["key"]
+        digest = hashlib.sha256(b"ns2lr-cache-%d\0" % CACHE_VERSION)
+        with io.open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        key = digest.hexdigest()
+        index[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "key": key}
+        self.write_index(index)
+        return key
+
+    def read_index(self):
+        try:
+            with io.open(self.index_path, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def write_index(self, index):
+        self.replace(self.index_path, json.dumps(index).encode("utf-8"))
+
+    def entry_paths(self, key):
+        base = os.path.join(self.directory, key)
+        return (base + ".npz", base + ".blob")
+
+    def load(self, key):
+        (arrays_path, blob_path) = self.entry_paths(key)
+        try:
+            with io.open(blob_path, "rb") as f:
+                blob = marshal.load(f)
+            with np.load(arrays_path) as arrays:
+                mesh = self.decode_mesh(arrays, blob["mesh"])
+        except (IOError, OSError, ValueError, EOFError, KeyError):
+            return None
+        for path in (arrays_path, blob_path):
+            os.utime(path, None)
+        elements = blob["elements"]
+        elements[2] = mesh
+        return CachedLevel(blob["version"], elements)
+
+    def store(self, key, level):
+        elements = dict(level.elements)
+        mesh = elements.pop(2)
+        (arrays, mesh_fields) = self.encode_mesh(mesh)
+        blob = {"version": level.version, "elements": elements, "mesh": mesh_fields}
+        (arrays_path, blob_path) = self.entry_paths(key)
+        stream = io.BytesIO()
+        np.savez(stream, **arrays)
+        self.replace(arrays_path, stream.getvalue())
+        self.replace(blob_path, marshal.dumps(blob))
+        self.evict()
+
+    def encode_mesh(self, mesh):
+        arrays = {}
+        fields = {}
+        if not isinstance(mesh, MeshArrays):
+            return (arrays, None)
+        for name, value in mesh.__dict__.items():
+            if isinstance(value, np.ndarray):
+                arrays[name] = value
+            else:
+                fields[name] = value
+        return (arrays, fields)
+
+    def decode_mesh(self, arrays, fields):
+        if fields is None:
+            return []
+        mesh = MeshArrays()
+        for name, value in fields.items():
+            setattr(mesh, name, value)
+        for name in arrays.files:
+            setattr(mesh, name, arrays[name])
+        return mesh
+
+    def replace(self, path, data):
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with io.open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def evict(self):
+        entries = {}
+        for name in os.listdir(self.directory):
+            (key, ext) = os.path.splitext(name)
+            if ext not in (".npz", ".blob"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            (mtime, size) = entries.get(key, (0, 0))
+            entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size)
+        total = sum(size for (mtime, size) in entries.values())
+        kept = set(entries)
+        for (mtime, key) in sorted((mtime, key) for (key, (mtime, size)) in entries.items()):
+            if total <= self.max_size:
+                break
+            for path in self.entry_paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= entries[key][1]
+            kept.discard(key)
+        # drop the index entries of the files whose entry is gone
+        index = self.read_index()
+        pruned = dict((path, entry) for (path, entry) in index.items() if entry["key"] in kept)
+        if len(pruned) != len(index):
+            self.write_index(pruned)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from parsers.chunkmeshparser import ChunkMeshParser, MESH_CHUNK_NAMES, iter_subchunks
+from parsers.chunkobjectparser import ChunkObjectParser
+from parsers.levelparser import LevelParser, ChunkParser, CHUNK_NAMES
+
+try:
+    import numpy as np
+    from elements.mesharrays import MeshArrays
+except ImportError:
+    np = None
+
+# number of changed element indices listed per mesh sub-chunk
+MAX_INDICES = 20
+
+
+def chunk_hash(data):
+    return hashlib.sha1(data).digest()
+
+
+class LevelChunks(object):
+
+    """Chunk table of a level file with a hash of every chunk"""
+
+    def __init__(self, filename):
+        self.parser = LevelParser(filename, use_mmap=True, lazy=True)
+        try:
+            self.parser.parse()
+        except Exception:
+            self.parser.close()
+            raise
+        self.version = self.parser.version
+        self.chunks = [(chunk_id, self.parser.data[offset:offset+chunk_length])
+                       for (chunk_id, offset, chunk_length) in self.parser.toc]
+        self.hashes = [chunk_hash(data) for (chunk_id, data) in self.chunks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for (chunk_id, data) in self.chunks:
+            try:
+                data.release()
+            except BufferError:
+                # still viewed by arrays of a failed decoding
+                pass
+        self.chunks = []
+        self.parser.close()
+
+    def of_type(self, chunk_id):
+        """Returns (position, data, hash) of the chunks of chunk_id"""
+        return [(i, data, self.hashes[i]) for i, (toc_chunk_id, data) in enumerate(self.chunks)
+                if toc_chunk_id == chunk_id]
+
+
+def unmatched(a, b):
+    """Returns the (position, data) of a and b whose hash has no
+    counterpart on the other side, counting repeated hashes"""
+    counts = {}
+    for (i, data, digest) in b:
+        counts[digest] = counts.get(digest, 0) + 1
+    only_a = []
+    for (i, data, digest) in a:
+        if counts.get(digest):
+            counts[digest] -= 1
+        else:
+            only_a.append((i, data))
+    counts = {}
+    for (i, data, digest) in a:
+        counts[digest] = counts.get(digest, 0) + 1
+    only_b = []
+    for (i, data, digest) in b:
+        if counts.get(digest):
+            counts[digest] -= 1
+        else:
+            only_b.append((i, data))
+    return (only_a, only_b)
+
+
+def entity_summary(entity):
+    summary = {"classname": entity["classname"]}
+    for name in ("name", "origin"):
+        if name in entity["properties"]:
+            summary[name] = entity["properties"][name]
+    return summary
+
+
+def diff_entity(a, b):
+    changes = {}
+    for field in ("classname", "groupid", "layerdata", "is_animated"):
+        if a[field] != b[field]:
+            changes[field] = [a[field], b[field]]
+    properties = {}
+    for name in sorted(set(a["properties"]) | set(b["properties"])):
+        (value_a, value_b) = (a["properties"].get(name), b["properties"].get(name))
+        if value_a != value_b or (name in a["properties"]) != (name in b["properties"]):
+            properties[name] = [value_a, value_b]
+    if properties:
+        changes["properties"] = properties
+    return changes
+
+
+def diff_entities(level_a, level_b):
+    """Decodes only the entity chunks without an identical counterpart and
+    pairs them up by classname in file order"""
+    (only_a, only_b) = unmatched(level_a.of_type(1), level_b.of_type(1))
+    decoded_a = [(i, ChunkObjectParser(data, level_a.version).parse()) for (i, data) in only_a]
+    decoded_b = [(i, ChunkObjectParser(data, level_b.version).parse()) for (i, data) in only_b]
+    result = {"added": [], "removed": [], "changed": []}
+    by_classname = {}
+    for (i, entity) in decoded_b:
+        by_classname.setdefault(entity["classname"], []).append((i, entity))
+    for (i, entity) in decoded_a:
+        candidates = by_classname.get(entity["classname"])
+        if not candidates:
+            result["removed"].append(dict(entity_summary(entity), chunk=i))
+            continue
+        (j, other) = candidates.pop(0)
+        result["changed"].append(dict(entity_summary(entity), chunk_a=i, chunk_b=j, changes=diff_entity(entity, other)))
+    for candidates in by_classname.values():
+        for (j, entity) in candidates:
+            result["added"].append(dict(entity_summary(entity), chunk=j))
+    return result
+
+
+def changed_rows(a, b):
+    """Returns the count in a and b and the indices of the common rows that
+    differ, for arrays or tuples of arrays of the same row layout"""
+    if not isinstance(a, tuple):
+        (a, b) = ((a,), (b,))
+    n = min(len(a[0]), len(b[0]))
+    changed = np.zeros(n, bool)
+    for (column_a, column_b) in zip(a, b):
+        difference = column_a[:n] != column_b[:n]
+        changed |= difference.reshape(n, -1).any(axis=1)
+    return (len(a[0]), len(b[0]), np.flatnonzero(changed))
+
+
+def changed_faces(a, b):
+    """Compares the face columns and the edges of every face"""
+    (count_a, count_b, changed) = changed_rows(
+        (a.face_angles, a.face_offsets, a.face_scales, a.face_mapping_groups, a.face_materials),
+        (b.face_angles, b.face_offsets, b.face_scales, b.face_mapping_groups, b.face_materials))
+    n = min(count_a, count_b)
+    face_edges_a = a.loop_edge_offsets[a.face_loop_offsets]
+    face_edges_b = b.loop_edge_offsets[b.face_loop_offsets]
+    loops_a = np.diff(a.face_loop_offsets)[:n]
+    loops_b = np.diff(b.face_loop_offsets)[:n]
+    edges_a = np.diff(face_edges_a)[:n]
+    edges_b = np.diff(face_edges_b)[:n]
+    same_shape = (loops_a == loops_b) & (edges_a == edges_b)
+    # edge rows and loop lengths of the faces of the same shape, side by side
+    faces = np.flatnonzero(same_shape)
+    counts = edges_a[faces]
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows_a = np.repeat(face_edges_a[faces], counts) + within
+    rows_b = np.repeat(face_edges_b[faces], counts) + within
+    edge_differs = (a.loop_edges[rows_a] != b.loop_edges[rows_b]).any(axis=1)
+    loop_counts = loops_a[faces]
+    within = np.arange(loop_counts.sum()) - np.repeat(np.cumsum(loop_counts) - loop_counts, loop_counts)
+    lengths_a = np.diff(a.loop_edge_offsets)[np.repeat(a.face_loop_offsets[faces], loop_counts) + within]
+    lengths_b = np.diff(b.loop_edge_offsets)[np.repeat(b.face_loop_offsets[faces], loop_counts) + within]
+    differs = np.zeros(n, bool)
+    differs[~same_shape] = True
+    differs[np.repeat(faces, counts)[edge_differs]] = True
+    differs[np.repeat(faces, loop_counts)[lengths_a != lengths_b]] = True
+    differs[changed] = True
+    return (count_a, count_b, np.flatnonzero(differs))
+
+
+def diff_subchunk(mesh_chunk_id, data_a, data_b, version):
+    """Decodes a mesh sub-chunk of both levels and returns the element
+    counts and the changed element indices where they are known"""
+    report = {"length": [len(data_a) if data_a is not None else None, len(data_b) if data_b is not None else None]}
+    if np is None or data_a is None or data_b is None:
+        return report
+    meshes = []
+    for data in (data_a, data_b):
+        mesh = MeshArrays()
+        ChunkMeshParser(b"", version, vectorized=True).parse_subchunk_arrays(mesh, mesh_chunk_id, data)
+        meshes.append(mesh)
+    (a, b) = meshes
+    if mesh_chunk_id == 1:
+        (count_a, count_b, changed) = changed_rows((a.positions, a.vertex_smoothing), (b.positions, b.vertex_smoothing))
+    elif mesh_chunk_id == 2:
+        (count_a, count_b, changed) = changed_rows((a.edges, a.edge_smooth), (b.edges, b.edge_smooth))
+    elif mesh_chunk_id == 3:
+        (count_a, count_b, changed) = changed_faces(a, b)
+    elif mesh_chunk_id == 5:
+        (count_a, count_b, changed) = changed_rows(a.triangles, b.triangles)
+    else:
+        return report
+    report["count"] = [count_a, count_b]
+    report["changed"] = len(changed)
+    report["indices"] = changed[:MAX_INDICES].tolist()
+    return report
+
+
+def diff_mesh(level_a, level_b):
+    """Compares the mesh sub-chunks of both levels by hash and decodes the
+    ones that differ"""
+    (mesh_a, mesh_b) = (level_a.of_type(2), level_b.of_type(2))
+    if [digest for (i, data, digest) in mesh_a] == [digest for (i, data, digest) in mesh_b]:
+        return {}
+    parts_a = dict(iter_subchunks(mesh_a[0][1])) if mesh_a else {}
+    parts_b = dict(iter_subchunks(mesh_b[0][1])) if mesh_b else {}
+    result = {}
+    for mesh_chunk_id in sorted(set(parts_a) | set(parts_b)):
+        (data_a, data_b) = (parts_a.get(mesh_chunk_id), parts_b.get(mesh_chunk_id))
+        if data_a is not None and data_b is not None and chunk_hash(data_a) == chunk_hash(data_b):
+            continue
+        name = MESH_CHUNK_NAMES.get(mesh_chunk_id, str(mesh_chunk_id))
+        result[name] = diff_subchunk(mesh_chunk_id, data_a, data_b, level_a.version)
+    return result
+
+
+def diff_levels(file_a, file_b):
+    """Returns the differences between two level files"""
+    with LevelChunks(file_a) as level_a, LevelChunks(file_b) as level_b:
+        result = {"a": file_a, "b": file_b, "chunks": {}}
+        if level_a.version != level_b.version:
+            result["version"] = [level_a.version, level_b.version]
+        for chunk_id in sorted(set(CHUNK_NAMES) | set(chunk_id for (chunk_id, data) in level_a.chunks + level_b.chunks)):
+            if chunk_id in (1, 2):
+                continue
+            (chunks_a, chunks_b) = (level_a.of_type(chunk_id), level_b.of_type(chunk_id))
+            if [digest for (i, data, digest) in chunks_a] == [digest for (i, data, digest) in chunks_b]:
+                continue
+            values = {}
+            for (side, level, chunks) in (("a", level_a, chunks_a), ("b", level_b, chunks_b)):
+                values[side] = [ChunkParser(chunk_id, data, level.version).parse_chunk() for (i, data, digest) in chunks]
+            result["chunks"][CHUNK_NAMES.get(chunk_id, str(chunk_id))] = values
+        entities = diff_entities(level_a, level_b)
+        if entities["added"] or entities["removed"] or entities["changed"]:
+            result["entities"] = entities
+        mesh = diff_mesh(level_a, level_b)
+        if mesh:
+            result["mesh"] = mesh
+    result["identical"] = not (result["chunks"] or "entities" in result or "mesh" in result or "version" in result)
+    return result
+
+
+def write_report(result, output):
+    if result["identical"]:
+        output.write("levels are identical\n")
+        return
+    if "version" in result:
+        output.write("version: %d -> %d\n" % tuple(result["version"]))
+    for name in sorted(result["chunks"]):
+        values = result["chunks"][name]
+        output.write("%s: changed (%d -> %d chunks)\n" % (name, len(values["a"]), len(values["b"])))
+    entities = result.get("entities")
+    if entities:
+        for entity in entities["removed"]:
+            output.write("entity removed: %s (chunk %d)\n" % (entity["classname"], entity["chunk"]))
+        for entity in entities["added"]:
+            output.write("entity added: %s (chunk %d)\n" % (entity["classname"], entity["chunk"]))
+        for entity in entities["changed"]:
+            output.write("entity changed: %s (chunk %d -> %d)\n" % (entity["classname"], entity["chunk_a"],
+                                                                  entity["chunk_b"]))
+            changes = entity["changes"]
+            for field in sorted(changes):
+                if field != "properties":
+                    output.write("    %s: %r -> %r\n" % (field, changes[field][0], changes[field][1]))
+            for name, (value_a, value_b) in sorted(changes.get("properties", {}).items()):
+                output.write("    %s: %r -> %r\n" % (name, value_a, value_b))
+    for name, report in sorted(result.get("mesh", {}).items()):
+        if "count" in report:
+            output.write("mesh/%s: %d -> %d, %d changed %s\n" % (name, report["count"][0], report["count"][1],
+                                                                 report["changed"], report["indices"]))
+        else:
+            output.write("mesh/%s: changed (%s -> %s bytes)\n" % (name, report["length"][0], report["length"][1]))
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(prog="ns2lr.py diff",
+                                        description="Lists the differences between two level files.")
+    argparser.add_argument("a", metavar="A")
+    argparser.add_argument("b", metavar="B")
+    argparser.add_argument("--json", action="store_true", help="write the differences as JSON")
+    options = argparser.parse_args(args)
+    for filename in (options.a, options.b):
+        if not os.path.exists(filename):
+            sys.exit("Error: file %s was not found!" % (filename))
+    result = diff_levels(options.a, options.b)
+    if options.json:
+        sys.stdout.write(json.dumps(result, sort_keys=True, default=repr) + "\n")
+    else:
+        write_report(result, sys.stdout)
+    return 0 if result["identical"] else 1
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+from struct import pack, unpack_from
+
+import errors
+from elements.Elements import ChunkEntity
+from parsers.chunkobjectparser import ChunkObjectParser
+from parsers.levelparser import LevelParser
+
+
+def copy_range(source, target, offset, length):
+    """Copies length bytes at offset of the file descriptor source to the
+    current position of the file descriptor target, in the kernel if the
+    platform allows it."""
+    end = offset + length
+    for name in ("copy_file_range", "sendfile"):
+        copy = getattr(os, name, None)
+        if copy is None:
+            continue
+        try:
+            while offset < end:
+                if name == "copy_file_range":
+                    copied = copy(source, target, end - offset, offset)
+                else:
+                    copied = copy(target, source, offset, end - offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            # not supported for these files, the next way resumes at offset
+            continue
+        if offset == end:
+            return
+    while offset < end:
+        data = os.pread(source, min(end - offset, 1 << 20), offset)
+        if not data:
+            raise errors.IOError("Error: expected %d bytes, read %d" % (length, length - (end - offset)))
+        write_all(target, data)
+        offset += len(data)
+
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class LevelPatcher(object):
+
+    """Edits chunks of a level file without rewriting the others.
+
+    The chunk layout of the file is kept: write() re-encodes only the
+    chunks given to replace_chunk() or changed by set_property(), and
+    copies every run of untouched chunks as one raw byte range.
+    Chunks are numbered by their position in the file, as in
+    LevelParser.toc.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.read_toc()
+
+    def read_toc(self):
+        with LevelParser(self.filename, use_mmap=True, lazy=True) as parser:
+            # only the chunk table is read, nothing is decoded
+            parser.parse()
+            self.version = parser.version
+            self.toc = parser.toc
+        self.patches = {}
+
+    def read_chunk_data(self, index):
+        """Returns the current body of chunk index"""
+        if index in self.patches:
+            return self.patches[index]
+        (chunk_id, offset, chunk_length) = self.toc[index]
+        with io.open(self.filename, "rb") as f:
+            f.seek(offset)
+            return f.read(chunk_length)
+
+    def entities(self):
+        """Returns (chunk index, entity) for every entity chunk"""
+        entities = []
+        with io.open(self.filename, "rb") as f:
+            for index, (chunk_id, offset, chunk_length) in enumerate(self.toc):
+                if chunk_id != 1:
+                    continue
+                if index in self.patches:
+                    data = self.patches[index]
+                else:
+                    f.seek(offset)
+                    data = f.read(chunk_length)
+                entities.append((index, ChunkObjectParser(data, self.version).parse()))
+        return entities
+
+    def replace_chunk(self, index, chunk):
+        """Replaces chunk index by a chunk element such as ChunkEntity"""
+        data = chunk.dump()
+        (chunk_id, length) = unpack_from("II", data)
+        if chunk_id != self.toc[index][0]:
+            raise errors.TypeError("Error: chunk %d has id %d, not %d" % (index, self.toc[index][0], chunk_id))
+        self.patches[index] = data[8:]
+
+    def set_property(self, index, name, value):
+        """Sets a property of the entity in chunk index.
+
+        Only the property chunk of name is re-encoded, keeping its
+        property type if it exists; the other property chunks are kept
+        byte for byte.
+        """
+        if self.toc[index][0] != 1:
+            raise errors.TypeError("Error: chunk %d is not an entity chunk" % (index))
+        data = self.read_chunk_data(index)
+        parser = ChunkObjectParser(data, self.version)
+        parser.parse_header()
+        if self.version == 10:
+            count_offset = parser.fp
+            num_properties = parser.read_unsigned_int32()
+        header = data[:parser.fp]
+        properties = []
+        prop_type = None
+        num_components = None
+        is_animated = False
+        while not parser.end():
+            prop_chunkid = parser.read_unsigned_int32()
+            prop_chunklen = parser.read_unsigned_int32()
+            body = data[parser.fp:parser.fp + prop_chunklen]
+            parser.skip(prop_chunklen)
+            if prop_chunkid == 2:
+                prop = ChunkObjectParser(body, self.version)
+                prop_name = prop.read_string(prop.read_unsigned_int32())
+                if prop_name == name:
+                    prop_type = prop.read_unsigned_int32()
+                    num_components = prop.read_unsigned_int32()
+                    is_animated = bool(prop.read_unsigned_int32())
+                    continue
+            properties.append(pack("II", prop_chunkid, prop_chunklen) + body)
+        encoder = ChunkEntity(None)
+        if prop_type is None:
+            prop_type = encoder.property_type(value)
+            if self.version == 10:
+                header = header[:count_offset] + pack("I", num_properties + 1)
+        body = encoder.dump_typed_property(name, prop_type, value, is_animated, num_components)
+        properties.append(pack("II", 2, len(body)) + body)
+        self.patches[index] = header + b"".join(properties)
+
+    def write(self, filename=None):
+        """Writes the patched level to filename, by default over the
+        original file. After writing over the original file, the chunk
+        table is read again and no patches are left, so the patcher can
+        be used further."""
+        target = filename or self.filename
+        temp_path = "%s.%d.tmp" % (target, os.getpid())
+        source = os.open(self.filename, os.O_RDONLY)
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            try:
+                self.write_chunks(source, fd)
+            finally:
+                os.close(fd)
+        finally:
+            os.close(source)
+        os.replace(temp_path, target)
+        if target == self.filename:
+            self.read_toc()
+
+    def write_chunks(self, source, fd):
+        # the header is copied along with the chunks that follow it
+        (copy_start, copy_end) = (0, 4)
+        for index, (chunk_id, offset, chunk_length) in enumerate(self.toc):
+            if index not in self.patches:
+                if offset - 8 != copy_end:
+                    copy_range(source, fd, copy_start, copy_end - copy_start)
+                    copy_start = offset - 8
+                copy_end = offset + chunk_length
+                continue
+            copy_range(source, fd, copy_start, copy_end - copy_start)
+            data = self.patches[index]
+            write_all(fd, pack("II", chunk_id, len(data)) + data)
+            (copy_start, copy_end) = (offset + chunk_length, offset + chunk_length)
+        copy_range(source, fd, copy_start, copy_end - copy_start)
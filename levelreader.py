@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 from ctypes import c_ubyte
-import pprint
 import sys
 import ctypes
 import io
@@ -10,18 +9,33 @@ from elements.Elements import *
 from parsers.binarywriter import BinaryWriter
 from parsers.levelparser import LevelParser
 
+try:
+    from elements.mesharrays import ChunkMeshArrays
+except ImportError:
+    ChunkMeshArrays = None
+
 
 class LevelReader(object):
 
     """Reads NS2 level files"""
 
-    def __init__(self):
+    def __init__(self, vectorized=False, cache=None, instrument=None, chunks=None, skip=None):
+        # a LevelCache holds meshes as MeshArrays, so it implies vectorized
+        self.vectorized = vectorized or cache is not None
+        self.cache = cache
+        self.instrument = instrument
+        # chunk selection, see LevelParser
+        self.chunks = chunks
+        self.skip = skip
+        self.mesh = None
         self.entities = []
         self.materials = []
         self.vertices = []
         self.edges = []
         self.faces = []
         self.triangles = []
+        self.ghostvertices = []
+        self.smoothednormals = []
         self.facelayers = []
         self.mappinggroups = []
         self.vertexgroups = []
@@ -29,20 +43,25 @@ class LevelReader(object):
         self.facegroups = []
         self.layers = []
         self.groups = []
+        self.viewport = []
+        self.customcolors = []
+        self.editorsettings = []
 
     def write_viewport(self, stream):
-        with io.open("chunkviewport.bin", "rb") as fh:
-            viewport_data = fh.read()
-            stream.write(viewport_data)
+        for viewport_xml in self.viewport:
+            ChunkViewport(viewport_xml).write(stream)
+
+    def write_customcolors(self, stream):
+        for customcolors in self.customcolors:
+            ChunkCustomColors(customcolors).write(stream)
 
     def write_editorsettings(self, stream):
-        with io.open("chunkeditorsettings.bin", "rb") as fh:
-            editor_settings_data = fh.read()
-            stream.write(editor_settings_data)
+        for editor_settings_data in self.editorsettings:
+            ChunkEditorSettings(editor_settings_data).write(stream)
 
     def write_header(self, stream, version):
         chunk = ChunkHeader(version)
-        stream.write(chunk.dump())
+        chunk.write(stream)
 
     def write_mesh(self, stream):
         materials = (
@@ -89,32 +108,46 @@ class LevelReader(object):
         ]
 
         #chunk = ChunkMesh(materials=materials, vertices=vertices, edges=edges, faces=faces, triangles=triangles, facelayers=facelayers)
-        chunk = ChunkMesh(materials=self.materials, vertices=self.vertices, edges=self.edges, faces=self.faces,
-                          triangles=self.triangles, facelayers=self.facelayers, mappinggroups=self.mappinggroups,
-                          vertexgroups=self.vertexgroups, edgegroups=self.edgegroups, facegroups=self.facegroups)
-        stream.write(chunk.dump())
+        if self.mesh is not None:
+            chunk = ChunkMeshArrays(self.mesh)
+        elif any((self.materials, self.vertices, self.edges, self.faces, self.triangles, self.facelayers,
+                  self.mappinggroups, self.vertexgroups, self.edgegroups, self.facegroups, self.ghostvertices,
+                  self.smoothednormals)):
+            chunk = ChunkMesh(materials=self.materials, vertices=self.vertices, edges=self.edges, faces=self.faces,
+                              triangles=self.triangles, facelayers=self.facelayers, mappinggroups=self.mappinggroups,
+                              vertexgroups=self.vertexgroups, edgegroups=self.edgegroups, facegroups=self.facegroups,
+                              ghostvertices=self.ghostvertices, smoothednormals=self.smoothednormals)
+        else:
+            # no mesh was read
+            return
+        chunk.write(stream)
         chunk = ChunkLayers(self.layers)
-        stream.write(chunk.dump())
+        if not chunk.empty():
+            chunk.write(stream)
         chunk = ChunkGroups(self.groups)
-        stream.write(chunk.dump())
+        if not chunk.empty():
+            chunk.write(stream)
 
-        data = b""
         for e in self.entities:
             chunk = ChunkEntity(e)
-            data += chunk.dump()
-        stream.write(data)
+            chunk.write(stream)
 
     def write_level(self, filename):
-        stream = io.open(filename, "wb")
-        self.write_header(stream, 10)
-        self.write_mesh(stream)
-        self.write_viewport(stream)
-        self.write_editorsettings(stream)
+        with io.open(filename, "wb") as stream:
+            self.write_header(stream, 10)
+            self.write_mesh(stream)
+            self.write_viewport(stream)
+            self.write_customcolors(stream)
+            self.write_editorsettings(stream)
 
     def read_level(self, filename):
 
-        parser = LevelParser(filename)
-        parser.parse()
+        if self.cache is not None:
+            parser = self.cache.parse(filename)
+        else:
+            parser = LevelParser(filename, use_mmap=True, vectorized=self.vectorized, instrument=self.instrument,
+                                 chunks=self.chunks, skip=self.skip)
+            parser.parse()
         entities = parser.get_entities()
         groups = parser.get_groups()
         mesh = parser.get_mesh()
@@ -122,38 +155,77 @@ class LevelReader(object):
         layers = parser.get_layers()
         viewport = parser.get_viewport()
         editorsettings = parser.get_editorsettings()
+        if self.cache is None:
+            parser.close()
+
+        self.entities = entities
+        self.viewport = viewport
+        self.customcolors = customcolors
+        self.editorsettings = editorsettings
+
+        if self.vectorized:
+            # the mesh stays in its columnar form, see elements/mesharrays.py,
+            # and is None if the level has none or it was not decoded
+            self.mesh = mesh or None
+        elif mesh:
+            self.read_mesh(mesh)
 
-        pprint.pprint(entities)
+        # layers
+        if layers:
+            for id, layer in layers.items():
+                self.layers.append(Layer(id, layer["name"], layer["is_visible"], layer["color"]))
+
+        # groups
+        if groups:
+            for id, group in groups.items():
+                self.groups.append(Group(id, group["name"], group["is_visible"], group["color"]))
+
+    def read_mesh(self, mesh):
+        """Builds the mesh elements. Edges, triangles and faces refer to
+        the vertices and edges they are built on, and are left out when
+        those were not decoded, see LevelParser chunks and skip."""
 
         # materials
         self.materials = mesh["materials"]
 
         # vertices
         for i, vertex in enumerate(mesh["vertices"]):
-            self.vertices.append(Vertex(i, vertex["x"], vertex["y"], vertex["z"]))
+            self.vertices.append(Vertex(i, vertex["x"], vertex["y"], vertex["z"], vertex["has_smoothing"]))
 
         # edges
-        for i, edge in enumerate(mesh["edges"]):
-            self.edges.append(Edge(i, self.vertices[edge["vi_1"]], self.vertices[edge["vi_2"]]))
+        for i, edge in enumerate(mesh["edges"] if self.vertices else ()):
+            self.edges.append(Edge(i, self.vertices[edge["vi_1"]], self.vertices[edge["vi_2"]], edge["smooth"]))
 
         # faces
-        for i, face in enumerate(mesh["faces"]):
-            border = []
-            for edge in face["border_edgeloop"]:
-                border.append({"edge": self.edges[edge["edge_index"]], "is_flipped": edge["is_flipped"]})
-            self.faces.append(Face(i, EdgeLoop(border), face["materialid"], face["scale"], face["offset"],
-                                   face["angle"], face["mapping_group_id"]))
+        for i, face in enumerate(mesh["faces"] if self.edges else ()):
+            edgeloops = []
+            for edgeloop in [face["border_edgeloop"]] + face["edgeloops"]:
+                edges = []
+                for edge in edgeloop:
+                    edges.append({"edge": self.edges[edge["edge_index"]], "is_flipped": edge["is_flipped"]})
+                edgeloops.append(EdgeLoop(edges))
+            self.faces.append(Face(i, edgeloops[0], face["materialid"], face["scale"], face["offset"],
+                                   face["angle"], face["mapping_group_id"], edgeloops[1:]))
 
         # triangles
-        triangles = {"total": mesh["triangles"]["total"], "faces": []}
-        for i, face_triangles in enumerate(mesh["triangles"]["faces"]):
-            triangles["faces"].append([])
-            for j, triangle in enumerate(face_triangles):
-                triangles["faces"][i].append(Triangle(
-                    self.vertices[triangle["vi_1"]],
-                    self.vertices[triangle["vi_2"]],
-                    self.vertices[triangle["vi_3"]]
-                ))
+        for i, vertex in enumerate(mesh["ghost_vertices"]):
+            self.ghostvertices.append(Vector(i, *vertex))
+        for i, normal in enumerate(mesh["smoothed_normals"]):
+            self.smoothednormals.append(Vector(i, *normal))
+        triangles = {}
+        if mesh["triangles"] and self.vertices:
+            triangles = {"total": mesh["triangles"]["total"], "faces": []}
+            for i, face_triangles in enumerate(mesh["triangles"]["faces"]):
+                triangles["faces"].append([])
+                for j, triangle in enumerate(face_triangles):
+                    triangles["faces"][i].append(Triangle(
+                        self.vertices[triangle["vi_1"]],
+                        self.vertices[triangle["vi_2"]],
+                        self.vertices[triangle["vi_3"]],
+                        self.smoothednormals[triangle["sni_1"]],
+                        self.smoothednormals[triangle["sni_2"]],
+                        self.smoothednormals[triangle["sni_3"]]
+                    ))
         self.triangles = triangles
 
         # face layers
@@ -161,24 +233,14 @@ class LevelReader(object):
             self.facelayers.append(Facelayer(facelayer))
 
         # mapping groups
-        for gid, group in mesh["mapping_groups"].items():
+        for gid, group in (mesh["mapping_groups"] or {}).items():
             self.mappinggroups.append(Mappinggroup(gid, group["angle"], group["scale"], group["offset"], group["normal"]))
 
         # geometry groups
-        for gid, indices in mesh["geometry_groups"]["vertexgroups"].items():
-            self.vertexgroups.append(Geometrygroup(gid, indices))
-        for gid, indices in mesh["geometry_groups"]["edgegroups"].items():
-            self.edgegroups.append(Geometrygroup(gid, indices))
-        for gid, indices in mesh["geometry_groups"]["facegroups"].items():
-            self.facegroups.append(Geometrygroup(gid, indices))
-
-        # layers
-        if layers:
-            for id, layer in layers.items():
-                self.layers.append(Layer(id, layer["name"], layer["is_visible"], layer["color"]))
-
-        # groups
-        if groups:
-            for id, group in groups.items():
-                self.groups.append(Group(id, group["name"], group["is_visible"], group["color"]))
-
+        if mesh["geometry_groups"]:
+            for gid, indices in mesh["geometry_groups"]["vertexgroups"].items():
+                self.vertexgroups.append(Geometrygroup(gid, indices))
+            for gid, indices in mesh["geometry_groups"]["edgegroups"].items():
+                self.edgegroups.append(Geometrygroup(gid, indices))
+            for gid, indices in mesh["geometry_groups"]["facegroups"].items():
+                self.facegroups.append(Geometrygroup(gid, indices))
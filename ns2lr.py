@@ -1,21 +1,76 @@
 #!/usr/bin/python
 # Reads NS2 level file.
 
+import json
+import logging
 import os
+import pprint
 import sys
 
 from levelreader import LevelReader
+from parsers.instrumentation import ChunkStats
+from parsers.levelparser import chunk_ids
+import errors
+import leveldiff
+import scanner
+
+USAGE = ("Usage: %s FILE [--chunks NAMES] [--skip NAMES] [--stats json|text] [--trace-memory]\n"
+         "       %s scan DIR [--jobs N] [--output FILE]\n"
+         "       %s diff A B [--json]")
+
+def option_value(options, name):
+    if name not in options:
+        return None
+    index = options.index(name)
+    return options[index + 1] if index + 1 < len(options) else ""
+
+def print_stats(stats, format):
+    totals = stats.as_dict()
+    if format == "json":
+        print(json.dumps(totals, sort_keys=True))
+        return
+    print("%-28s %7s %12s %10s %10s %12s" % ("chunk", "count", "bytes", "seconds", "elements", "peak"))
+    for name in sorted(totals):
+        total = totals[name]
+        print("%-28s %7d %12d %10.4f %10d %12s" % (name, total["chunks"], total["bytes"], total["seconds"],
+                                                  total["elements"], total["peak"] if total["peak"] is not None else "-"))
 
 def main(args):
+    # diagnostics such as "Reading level" go to stderr, output to stdout
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     if len(args) < 2:
-        sys.exit("Usage: %s FILE" % (sys.argv[0]))
-    if not os.path.exists(sys.argv[1]):
-        sys.exit("Error: file %s was not found!" % (sys.argv[1]))
-    filename = sys.argv[1]
-    parser = LevelReader()
-    parser.read_level("C:\\Personal\\levels\\hmm.level")
-    parser.write_level("C:\\Personal\\levels\\written.level")
-    parser.read_level("C:\\Personal\\levels\\written.level")
+        sys.exit(USAGE % (args[0], args[0], args[0]))
+    if args[1] == "scan":
+        return scanner.main(args[2:])
+    if args[1] == "diff":
+        return leveldiff.main(args[2:])
+    if not os.path.exists(args[1]):
+        sys.exit("Error: file %s was not found!" % (args[1]))
+    filename = args[1]
+    options = args[2:]
+    stats = None
+    format = option_value(options, "--stats")
+    if format is not None:
+        if format not in ("json", "text"):
+            sys.exit(USAGE % (args[0], args[0], args[0]))
+        stats = ChunkStats(trace_memory="--trace-memory" in options)
+    # comma separated chunk names, such as layers,groups or mesh/triangles
+    (chunks, skip) = [option_value(options, name) for name in ("--chunks", "--skip")]
+    if chunks is not None:
+        chunks = [name for name in chunks.split(",") if name]
+    if skip is not None:
+        skip = [name for name in skip.split(",") if name]
+    for name in (chunks or []) + (skip or []):
+        try:
+            chunk_ids(name)
+        except errors.TypeError as e:
+            sys.exit(e.value)
+    parser = LevelReader(instrument=stats, chunks=chunks, skip=skip)
+    parser.read_level(filename)
+    if stats is not None:
+        print_stats(stats, format)
+    else:
+        pprint.pprint(parser.entities)
 
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
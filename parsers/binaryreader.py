@@ -0,0 +1,88 @@
+from struct import Struct
+from errors import IOError
+import errors
+
+
+UNSIGNED_CHAR8 = Struct("B")
+UNSIGNED_INT32 = Struct("I")
+SIGNED_INT32 = Struct("i")
+FLOAT32 = Struct("f")
+VEC2_FLOAT32 = Struct("ff")
+VEC3_FLOAT32 = Struct("fff")
+COLOR = Struct("BBBB")
+
+
+class BinaryReader(object):
+
+    """Reads binary level data from a buffer.
+
+    The buffer is wrapped in a memoryview, so read_bytes() and the readers
+    built on top of it hand out windows into the original data instead of
+    copies.
+    """
+
+    def __init__(self, data):
+        if not isinstance(data, memoryview):
+            data = memoryview(data)
+        self.data = data
+        self.size = len(data)
+        self.fp = 0
+
+    def end(self):
+        return (self.fp >= self.size)
+
+    def seek(self, pos):
+        if pos >= 0 and pos < self.size:
+            self.fp = pos
+        else:
+            raise errors.IOError("Error: unable to seek to position: %d" % pos)
+
+    def skip(self, n):
+        if self.fp + n > self.size:
+            raise IOError("Error: expected %d bytes, read %d" % (n, self.size - self.fp))
+        self.fp += n
+
+    def unpack(self, fmt):
+        fp = self.fp
+        end = fp + fmt.size
+        if end > self.size:
+            raise IOError("Error: expected %d bytes, read %d" % (fmt.size, self.size - fp))
+        self.fp = end
+        return fmt.unpack_from(self.data, fp)
+
+    def read_unsigned_char8(self):
+        return self.unpack(UNSIGNED_CHAR8)[0]
+
+    def read_unsigned_int32(self):
+        return self.unpack(UNSIGNED_INT32)[0]
+
+    def read_signed_int32(self):
+        return self.unpack(SIGNED_INT32)[0]
+
+    def read_float32(self):
+        return self.unpack(FLOAT32)[0]
+
+    def read_vec2_float32(self):
+        return self.unpack(VEC2_FLOAT32)
+
+    def read_vec3_float32(self):
+        return self.unpack(VEC3_FLOAT32)
+
+    def read_string(self, n):
+        data = self.read_bytes(n)
+        return str(data, "utf-8")
+
+    def read_widestring(self, n):
+        data = self.read_bytes(n)
+        return str(data, "utf-16")
+
+    def read_color(self):
+        return self.unpack(COLOR)
+
+    def read_bytes(self, n):
+        data = self.data[self.fp:self.fp+n]
+        if len(data) < n:
+            raise IOError("Error: expected %d bytes, read %d" % (n, len(data)))
+        else:
+            self.fp += n
+            return data
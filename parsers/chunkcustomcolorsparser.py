@@ -17,4 +17,5 @@ class ChunkCustomColorsParser(BinaryReader):
                 "green": color[1],
                 "blue": color[2],
                 "alpha": color[3]
-            })
\ No newline at end of file
+            })
+        return self.customcolors
@@ -9,7 +9,7 @@ class ChunkEditorSettingsParser(BinaryReader):
 
     def parse(self):
 
-        return self.data
+        return self.data.tobytes()
 
         unknown_field_1 = self.read_unsigned_int32()
         unknown_field_2 = self.read_unsigned_int32()
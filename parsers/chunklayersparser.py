@@ -12,7 +12,7 @@ class ChunkLayersParser(BinaryReader):
         num_layers = self.read_unsigned_int32()
         for i in range(num_layers):
             wide_string_len = self.read_unsigned_int32()
-            layer_name = self.read_string(2 * wide_string_len)
+            layer_name = self.read_widestring(2 * wide_string_len)
             is_visible = bool(self.read_unsigned_int32())
             color = self.read_color()
             layer_id = self.read_unsigned_int32()
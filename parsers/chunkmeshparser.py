@@ -1,13 +1,49 @@
+import logging
 import pprint
 import errors
 from parsers.binaryreader import BinaryReader
+from parsers.instrumentation import measure
+
+try:
+    from parsers import meshrecords
+    from elements.mesharrays import MeshArrays, GROUP_KINDS
+except ImportError:
+    meshrecords = None
+
+logger = logging.getLogger(__name__)
+
+MESH_CHUNK_NAMES = {
+    1: "vertices",
+    2: "edges",
+    3: "faces",
+    4: "materials",
+    5: "triangles",
+    6: "facelayers",
+    7: "mappinggroups",
+    8: "geometrygroups"
+}
+
+
+def iter_subchunks(data):
+    """Yields the (sub-chunk id, data) of the sub-chunks of a mesh chunk"""
+    reader = BinaryReader(data)
+    while not reader.end():
+        mesh_chunk_id = reader.read_unsigned_int32()
+        mesh_chunk_length = reader.read_unsigned_int32()
+        yield (mesh_chunk_id, reader.read_bytes(mesh_chunk_length))
 
 
 class ChunkMeshParser(BinaryReader):
 
-    def __init__(self, data, version):
+    def __init__(self, data, version, vectorized=False, instrument=None, subchunks=None):
         super(ChunkMeshParser, self).__init__(data)
         self.version = version
+        self.vectorized = vectorized
+        self.instrument = instrument
+        # ids of the sub-chunks to decode, None for all
+        self.subchunks = subchunks
+        if vectorized and meshrecords is None:
+            raise ImportError("numpy is required for vectorized mesh decoding")
 
         self.viewport_xml = ""
         self.editor_settings_data = ""
@@ -25,33 +61,19 @@ class ChunkMeshParser(BinaryReader):
 
     def parse(self):
 
+        if self.vectorized:
+            return self.parse_arrays()
+
         while not self.end():
 
             mesh_chunk_id = self.read_unsigned_int32()
             mesh_chunk_length = self.read_unsigned_int32()
+            if self.subchunks is not None and mesh_chunk_id not in self.subchunks:
+                self.skip(mesh_chunk_length)
+                continue
             mesh_chunk = self.read_bytes(mesh_chunk_length)
-
-            print("\tid: %d, length: %d" % (mesh_chunk_id, len(mesh_chunk)))
-
-            if mesh_chunk_id == 1:
-                self.vertices = self.parse_chunk_vertices(mesh_chunk)
-            elif mesh_chunk_id == 2:
-                self.edges = self.parse_chunk_edges(mesh_chunk)
-            elif mesh_chunk_id == 3:
-                self.faces = self.parse_chunk_faces(mesh_chunk)
-            elif mesh_chunk_id == 4:
-                self.materials = self.parse_chunk_materials(mesh_chunk)
-            elif mesh_chunk_id == 5:
-                (self.ghost_vertices, self.smoothed_normals, self.triangles) = self.parse_chunk_triangles(mesh_chunk)
-            elif mesh_chunk_id == 6:
-                self.face_layers = self.parse_chunk_facelayers(mesh_chunk)
-            elif mesh_chunk_id == 7:
-                self.mapping_groups = self.parse_chunk_mappinggroups(mesh_chunk)
-            elif mesh_chunk_id == 8:
-                self.geometry_groups = self.parse_chunk_geometrygroups(mesh_chunk)
-            else:
-                print("Warning: unknown mesh chunk id: %d" % (mesh_chunk_id))
-                data = self.read_bytes(mesh_chunk_length)
+            measure(self.instrument, mesh_chunk_id, mesh_chunk_length,
+                    lambda: self.parse_subchunk(mesh_chunk_id, mesh_chunk), int, parent=2)
 
         mesh_data = {
             "vertices": self.vertices,
@@ -67,6 +89,96 @@ class ChunkMeshParser(BinaryReader):
         }
         return mesh_data
 
+    def parse_subchunk(self, mesh_chunk_id, mesh_chunk):
+        """Decodes one mesh sub-chunk, returns its number of elements"""
+        if mesh_chunk_id == 1:
+            self.vertices = self.parse_chunk_vertices(mesh_chunk)
+            return len(self.vertices)
+        elif mesh_chunk_id == 2:
+            self.edges = self.parse_chunk_edges(mesh_chunk)
+            return len(self.edges)
+        elif mesh_chunk_id == 3:
+            self.faces = self.parse_chunk_faces(mesh_chunk)
+            return len(self.faces)
+        elif mesh_chunk_id == 4:
+            self.materials = self.parse_chunk_materials(mesh_chunk)
+            return len(self.materials)
+        elif mesh_chunk_id == 5:
+            (self.ghost_vertices, self.smoothed_normals, self.triangles) = self.parse_chunk_triangles(mesh_chunk)
+            return self.triangles["total"]
+        elif mesh_chunk_id == 6:
+            self.face_layers = self.parse_chunk_facelayers(mesh_chunk)
+            return len(self.face_layers)
+        elif mesh_chunk_id == 7:
+            self.mapping_groups = self.parse_chunk_mappinggroups(mesh_chunk)
+            return len(self.mapping_groups)
+        elif mesh_chunk_id == 8:
+            self.geometry_groups = self.parse_chunk_geometrygroups(mesh_chunk)
+            return sum(len(groups) for groups in self.geometry_groups.values())
+        logger.warning("Unknown mesh chunk id: %d", mesh_chunk_id)
+        return 0
+
+    def parse_arrays(self):
+
+        mesh = MeshArrays()
+
+        while not self.end():
+
+            mesh_chunk_id = self.read_unsigned_int32()
+            mesh_chunk_length = self.read_unsigned_int32()
+            if self.subchunks is not None and mesh_chunk_id not in self.subchunks:
+                self.skip(mesh_chunk_length)
+                continue
+            mesh_chunk = self.read_bytes(mesh_chunk_length)
+            measure(self.instrument, mesh_chunk_id, mesh_chunk_length,
+                    lambda: self.parse_subchunk_arrays(mesh, mesh_chunk_id, mesh_chunk), int, parent=2)
+
+        return mesh
+
+    def parse_subchunk_arrays(self, mesh, mesh_chunk_id, mesh_chunk):
+        """Decodes one mesh sub-chunk into mesh, returns its number of
+        elements"""
+        parser = BinaryReader(mesh_chunk)
+        if mesh_chunk_id == 1:
+            (mesh.positions, mesh.vertex_smoothing) = meshrecords.read_vertices(parser)
+            return mesh.num_vertices()
+        elif mesh_chunk_id == 2:
+            (mesh.edges, mesh.edge_smooth) = meshrecords.read_edges(parser)
+            return mesh.num_edges()
+        elif mesh_chunk_id == 3:
+            faces = meshrecords.read_faces(parser)
+            mesh.face_angles = faces["angles"]
+            mesh.face_offsets = faces["offsets"]
+            mesh.face_scales = faces["scales"]
+            mesh.face_mapping_groups = faces["mapping_groups"]
+            mesh.face_materials = faces["materials"]
+            mesh.face_loop_offsets = faces["loop_offsets"]
+            mesh.loop_edge_offsets = faces["edge_offsets"]
+            mesh.loop_edges = faces["edges"]
+            return mesh.num_faces()
+        elif mesh_chunk_id == 4:
+            mesh.materials = self.parse_chunk_materials(mesh_chunk)
+            return len(mesh.materials)
+        elif mesh_chunk_id == 5:
+            (mesh.ghost_vertices, mesh.smoothed_normals, mesh.triangles,
+             mesh.face_triangle_offsets, mesh.num_triangles) = meshrecords.read_triangles(parser)
+            return mesh.num_triangles
+        elif mesh_chunk_id == 6:
+            (mesh.face_layer_counts, mesh.face_layer_bits) = meshrecords.read_facelayers(parser)
+            return len(mesh.face_layer_counts)
+        elif mesh_chunk_id == 7:
+            mesh.mapping_groups = self.parse_chunk_mappinggroups(mesh_chunk)
+            return len(mesh.mapping_groups)
+        elif mesh_chunk_id == 8:
+            groups = meshrecords.read_geometrygroups(parser)
+            for kind, (ids, offsets, indices) in zip(GROUP_KINDS, groups):
+                setattr(mesh, kind + "_group_ids", ids)
+                setattr(mesh, kind + "_group_offsets", offsets)
+                setattr(mesh, kind + "_group_indices", indices)
+            return sum(len(ids) for (ids, offsets, indices) in groups)
+        logger.warning("Unknown mesh chunk id: %d", mesh_chunk_id)
+        return 0
+
     def parse_chunk_vertices(self, chunk):
         parser = BinaryReader(chunk)
         vertices = []
@@ -1,11 +1,84 @@
-from parsers.binaryreader import BinaryReader
+import struct
+from struct import Struct
+
+from parsers.binaryreader import BinaryReader, UNSIGNED_INT32, SIGNED_INT32
+from parsers.stringtable import EntityProperties, STRINGS
 import errors
 
+PROPERTY_CHUNK = Struct("II")
+PROPERTY_HEADER = Struct("III")
+
+ANGLE_KEYS = ("roll", "pitch", "yaw")
+
+# (prop_type, num_components) -> decoder(data, offset) of the property value
+DECODERS = {}
+
+
+def decode_string(data, offset):
+    length = UNSIGNED_INT32.unpack_from(data, offset)[0]
+    offset += 4
+    if offset + 2 * length > len(data):
+        raise struct.error("string of %d characters" % length)
+    return str(data[offset:offset + 2 * length], "utf-16")
+
+
+def property_decoder(prop_type, num_components):
+    """Builds the decoder of a property type and component count and adds
+    it to DECODERS. Float properties are read with one Struct of their
+    components; components beyond the fourth are ignored."""
+    if prop_type in (0, 4):
+        # Type_String
+        decode = decode_string
+    elif prop_type == 1:
+        # Type_Boolean
+        decode = lambda data, offset: bool(UNSIGNED_INT32.unpack_from(data, offset)[0])
+    elif prop_type in (3, 10):
+        # Type_Integer, Type_Choice
+        decode = lambda data, offset: SIGNED_INT32.unpack_from(data, offset)[0]
+    elif prop_type in (2, 5, 6, 7, 8, 9):
+        # Type_Float
+        components = Struct("%df" % min(num_components, 4))
+        if prop_type == 7:
+            if num_components not in (1, 2, 3):
+                raise errors.ParseError("Error: Type_Angle requires at least one component.")
+            keys = ANGLE_KEYS[:num_components]
+            decode = lambda data, offset: dict(zip(keys, components.unpack_from(data, offset)))
+        elif prop_type == 5:
+            if num_components < 3:
+                raise errors.ParseError("Error: Type_Color requires at least three components.")
+            def decode(data, offset):
+                color = components.unpack_from(data, offset)
+                return {
+                    "red": color[0],
+                    "green": color[1],
+                    "blue": color[2],
+                    "alpha": color[3] if len(color) == 4 else 1
+                }
+        elif num_components == 1:
+            decode = lambda data, offset: components.unpack_from(data, offset)[0]
+        else:
+            # vectors such as origin keep all their components
+            decode = components.unpack_from
+    else:
+        raise errors.ParseError("Error: invalid property type: %d" % prop_type)
+    DECODERS[(prop_type, num_components)] = decode
+    return decode
+
 
 class ChunkObjectParser(BinaryReader):
-    def __init__(self, data, version):
+
+    """Decodes an entity chunk.
+
+    Classnames and property names are interned through strings, a
+    StringTable, by default the one of the process. The property_types of
+    the entity map the property names to their (prop_type, num_components,
+    is_animated) as read, so that the entity can be written back unchanged.
+    """
+
+    def __init__(self, data, version, strings=None):
         super(ChunkObjectParser, self).__init__(data)
         self.version = version
+        self.strings = STRINGS if strings is None else strings
 
     def parse_layerdata(self):
             layerdata = {}
@@ -19,110 +92,67 @@ class ChunkObjectParser(BinaryReader):
                     layerdata["bitvalues"].append(bitmask)
             return layerdata
 
-    def parse_type_float(self, prop_type, num_components):
-        prop = None
-        components = []
-        for i in range(num_components):
-            if i < 4:
-                # Components beyond the fourth are ignored
-                component_value = self.read_float32()
-                components.append(component_value)
-        if (prop_type in (2, 6, 8, 9)):
-            prop = components[0]
-        elif (prop_type == 7):
-            if len(components) == 3:
-                prop = {
-                    "roll": components[0],
-                    "pitch": components[1],
-                    "yaw": components[2]
-                }
-            elif len(components) == 2:
-                prop = {
-                    "roll": components[0],
-                    "pitch": components[1]
-                }
-            elif len(components) == 1:
-                prop = {
-                    "roll": components[0]
-                }
-            else:
-                raise errors.ParseError("Error: Type_Angle requires at least one component.")
-        elif (prop_type == 5):
-            if len(components) < 4:
-                alpha = 1
-            else:
-                alpha = components[3]
-            prop = {
-                "red": components[0],
-                "green": components[1],
-                "blue": components[2],
-                "alpha": alpha
-            }
-        return prop
-
-    def parse(self):
-
+    def parse_header(self):
         layerdata = self.parse_layerdata()
         groupid = self.read_unsigned_int32()
         classname_len = self.read_unsigned_int32()
-        classname = self.read_string(classname_len)
-        properties = {}
+        classname = self.strings.string(self.read_bytes(classname_len))
+        return (layerdata, groupid, classname)
 
-        if self.version == 10:
-            num_properties = self.read_unsigned_int32()
-
-        while not self.end():
-
-            prop_chunkid = self.read_unsigned_int32()
-            if self.version == 10 and (prop_chunkid != 2):
-                continue
-            prop_chunklen = self.read_unsigned_int32()
-            prop_name_len = self.read_unsigned_int32()
-            prop_name = self.read_string(prop_name_len)
-            prop_type = self.read_unsigned_int32()
-            num_components = self.read_unsigned_int32()
-            is_animated = bool(self.read_unsigned_int32())
-
-            # Type_Float
-            if (prop_type in (2, 5, 6, 7, 8, 9)):
-
-                properties[prop_name] = self.parse_type_float(prop_type, num_components)
+    def parse(self, classnames=None):
 
-            elif (prop_type in (0, 1, 3, 4, 10)):
+        (layerdata, groupid, classname) = self.parse_header()
+        if classnames is not None and classname not in classnames:
+            return None
+        names = []
+        values = []
+        types = []
+        is_animated = False
 
-                if prop_name not in properties:
-                    properties[prop_name] = None
-
-                # Type_String
-                if (prop_type in (0, 4)):
-                    wide_string_len = self.read_unsigned_int32()
-                    wide_string_value = self.read_string(2 * wide_string_len)
-                    properties[prop_name] = wide_string_value
-
-                # Type_Boolean
-                elif (prop_type == 1):
-                    boolean_value = bool(self.read_unsigned_int32())
-                    properties[prop_name] = boolean_value
-
-                # Type_Integer
-                elif (prop_type == 3):
-                    integer_value = self.read_signed_int32()
-                    properties[prop_name] = integer_value
-
-                # Type_Choice
-                elif (prop_type == 10):
-                    choice_value = self.read_signed_int32()
-                    properties[prop_name] = choice_value
+        if self.version == 10:
+            num_properties = self.read_unsigned_int32()
 
-            else:
-                raise errors.ParseError("Error: invalid property type: %d" % prop_type)
+        data = self.data
+        string = self.strings.string
+        try:
+            while not self.end():
+                (prop_chunkid, prop_chunklen) = PROPERTY_CHUNK.unpack_from(data, self.fp)
+                fp = self.fp + 8
+                chunk_end = fp + prop_chunklen
+                if chunk_end > self.size:
+                    raise errors.IOError("Error: expected %d bytes, read %d" % (prop_chunklen, self.size - fp))
+                self.fp = chunk_end
+                if self.version == 10 and (prop_chunkid != 2):
+                    continue
+                prop_name_len = UNSIGNED_INT32.unpack_from(data, fp)[0]
+                fp += 4
+                names.append(string(data[fp:fp+prop_name_len]))
+                fp += prop_name_len
+                header = PROPERTY_HEADER.unpack_from(data, fp)
+                (prop_type, num_components, is_animated) = header
+                decode = DECODERS.get((prop_type, num_components))
+                if decode is None:
+                    decode = property_decoder(prop_type, num_components)
+                values.append(decode(data, fp + 12))
+                types.append(header)
+        except struct.error as e:
+            raise errors.IOError("Error: truncated property chunk: %s" % e)
+        is_animated = bool(is_animated)
+        if self.strings.compact:
+            layout = self.strings.layout(tuple(names))
+            properties = EntityProperties(layout, values)
+            property_types = EntityProperties(layout, types)
+        else:
+            properties = dict(zip(names, values))
+            property_types = dict(zip(names, types))
 
         entity = {
             "classname": classname,
             "groupid": groupid,
             "layerdata": layerdata,
             "is_animated": is_animated,
-            "properties": properties
+            "properties": properties,
+            "property_types": property_types
         }
 
-        return entity
\ No newline at end of file
+        return entity
@@ -0,0 +1,108 @@
+import time
+import tracemalloc
+
+
+class ChunkEvent(object):
+
+    """Report of one decoded chunk or mesh sub-chunk.
+
+    parent is None for top level chunks and the id of the enclosing chunk
+    for sub-chunks. peak is the tracemalloc peak in bytes above the memory
+    in use before decoding, or None if memory is not traced.
+    """
+
+    def __init__(self, chunk_id, length, seconds, count, peak=None, parent=None):
+        self.chunk_id = chunk_id
+        self.length = length
+        self.seconds = seconds
+        self.count = count
+        self.peak = peak
+        self.parent = parent
+
+
+# [start, peak] memory of the chunks being measured, innermost last
+_memory_stack = []
+
+
+def measure(instrument, chunk_id, length, decode, count, parent=None):
+    """Returns decode() and reports its time and count(value) to instrument.
+
+    instrument is any callable taking a ChunkEvent. If it has a true
+    trace_memory attribute, the tracemalloc peak of the decoding is
+    reported as well; tracing is started for the call if needed.
+    """
+    if instrument is None:
+        return decode()
+    trace_memory = getattr(instrument, "trace_memory", False)
+    if trace_memory:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        (current, peak) = tracemalloc.get_traced_memory()
+        if _memory_stack:
+            _memory_stack[-1][1] = max(_memory_stack[-1][1], peak)
+        _memory_stack.append([current, current])
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        value = decode()
+    finally:
+        seconds = time.perf_counter() - start
+        if trace_memory:
+            (base, peak) = _memory_stack.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if _memory_stack:
+                _memory_stack[-1][1] = max(_memory_stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            if started:
+                tracemalloc.stop()
+    instrument(ChunkEvent(chunk_id, length, seconds, count(value), peak - base if trace_memory else None, parent))
+    return value
+
+
+class ChunkStats(object):
+
+    """Instrument that sums up the events per chunk type.
+
+    Totals are keyed by chunk name, "mesh/triangles" style for mesh
+    sub-chunks, see as_dict().
+    """
+
+    def __init__(self, trace_memory=False):
+        # imported here, levelparser imports this module
+        from parsers.levelparser import CHUNK_NAMES
+        from parsers.chunkmeshparser import MESH_CHUNK_NAMES
+        self.chunk_names = CHUNK_NAMES
+        self.mesh_chunk_names = MESH_CHUNK_NAMES
+        self.trace_memory = trace_memory
+        self.totals = {}
+
+    def __call__(self, event):
+        if event.parent is None:
+            name = self.chunk_names.get(event.chunk_id, str(event.chunk_id))
+        else:
+            name = "%s/%s" % (self.chunk_names.get(event.parent, str(event.parent)),
+                              self.mesh_chunk_names.get(event.chunk_id, str(event.chunk_id)))
+        total = self.totals.get(name)
+        if total is None:
+            total = self.totals[name] = {"chunks": 0, "bytes": 0, "seconds": 0.0, "elements": 0, "peak": None}
+        total["chunks"] += 1
+        total["bytes"] += event.length
+        total["seconds"] += event.seconds
+        total["elements"] += event.count
+        if event.peak is not None:
+            total["peak"] = max(total["peak"] or 0, event.peak)
+
+    def as_dict(self):
+        """Returns the totals per chunk name and the sum over the top level
+        chunks under "total"."""
+        stats = dict((name, dict(total)) for name, total in self.totals.items())
+        top_level = [total for name, total in self.totals.items() if "/" not in name]
+        stats["total"] = {
+            "chunks": sum(total["chunks"] for total in top_level),
+            "bytes": sum(total["bytes"] for total in top_level),
+            "seconds": sum(total["seconds"] for total in top_level),
+            "elements": sum(total["elements"] for total in top_level),
+            "peak": max([total["peak"] for total in top_level if total["peak"] is not None] or [None])
+        }
+        return stats
@@ -1,28 +1,45 @@
 import os
 import io
+import logging
+import mmap
 import errors
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 from parsers.binaryreader import BinaryReader
+from parsers.instrumentation import measure
 
 from parsers.chunkobjectparser import ChunkObjectParser
-from parsers.chunkmeshparser import ChunkMeshParser
+from parsers.stringtable import StringTable
+from parsers.chunkmeshparser import ChunkMeshParser, MESH_CHUNK_NAMES
 from parsers.chunklayersparser import ChunkLayersParser
 from parsers.chunkviewportparser import ChunkViewportParser
 from parsers.chunkgroupsparser import ChunkGroupsParser
 from parsers.chunkcustomcolorsparser import ChunkCustomColorsParser
 from parsers.chunkeditorsettingsparser import ChunkEditorSettingsParser
 
+logger = logging.getLogger(__name__)
+
+CHUNK_NAMES = {
+    1: "entities",
+    2: "mesh",
+    3: "layers",
+    4: "viewport",
+    5: "groups",
+    6: "customcolors",
+    7: "editorsettings"
+}
+
+
 class ChunkParser(object):
 
-    def __init__(self, chunk_id, chunk, version):
+    def __init__(self, chunk_id, chunk, version, vectorized=False, instrument=None, subchunks=None, strings=None):
         self.chunk_parser = None
 
-        print("id: %d, length: %d" % (chunk_id, len(chunk)))
-
         if chunk_id == 1:
-            self.chunk_parser = ChunkObjectParser(chunk, version)
+            self.chunk_parser = ChunkObjectParser(chunk, version, strings)
         elif chunk_id == 2:
-            self.chunk_parser = ChunkMeshParser(chunk, version)
+            self.chunk_parser = ChunkMeshParser(chunk, version, vectorized, instrument, subchunks)
         elif chunk_id == 3:
             self.chunk_parser = ChunkLayersParser(chunk, version)
         elif chunk_id == 4:
@@ -39,71 +56,282 @@ class ChunkParser(object):
     def parse_chunk(self):
         return self.chunk_parser.parse()
 
+
+def chunk_ids(name):
+    """Returns the (chunk id, mesh sub-chunk id or None) of a chunk name
+    such as "layers" or "mesh/triangles", or of a chunk id"""
+    if isinstance(name, int):
+        return (name, None)
+    (chunk_name, _, subchunk_name) = name.partition("/")
+    chunk_id = dict((value, key) for key, value in CHUNK_NAMES.items()).get(chunk_name)
+    subchunk_id = dict((value, key) for key, value in MESH_CHUNK_NAMES.items()).get(subchunk_name)
+    if chunk_id is None or (subchunk_name and (chunk_id != 2 or subchunk_id is None)):
+        raise errors.TypeError("Error: unknown chunk: %s" % (name))
+    return (chunk_id, subchunk_id)
+
+
+def chunk_selection(chunks=None, skip=None):
+    """Returns the ids of the chunks to decode, None for all, the ids of the
+    chunks not to decode and the ids of the mesh sub-chunks to decode, None
+    for all. chunks are the chunks wanted, all if None, and skip the chunks
+    not wanted, see chunk_ids()."""
+    chunk_set = None
+    subchunk_set = set(MESH_CHUNK_NAMES)
+    if chunks is not None:
+        chunk_set = set()
+        subchunk_set = set()
+        for name in chunks:
+            (chunk_id, subchunk_id) = chunk_ids(name)
+            chunk_set.add(chunk_id)
+            if subchunk_id is not None:
+                subchunk_set.add(subchunk_id)
+            elif chunk_id == 2:
+                subchunk_set.update(MESH_CHUNK_NAMES)
+    skipped = set()
+    for name in skip or ():
+        (chunk_id, subchunk_id) = chunk_ids(name)
+        if subchunk_id is None:
+            skipped.add(chunk_id)
+        else:
+            subchunk_set.discard(subchunk_id)
+    if subchunk_set == set(MESH_CHUNK_NAMES):
+        subchunk_set = None
+    return (chunk_set, skipped, subchunk_set)
+
+
+def chunk_count(chunk_id, value):
+    """Returns the number of elements in a decoded chunk"""
+    if chunk_id == 2:
+        if isinstance(value, dict):
+            triangles = value["triangles"]["total"] if value["triangles"] else 0
+            return len(value["vertices"]) + len(value["edges"]) + len(value["faces"]) + triangles
+        return value.num_vertices() + value.num_edges() + value.num_faces() + value.num_triangles
+    if chunk_id in (3, 5, 6):
+        return len(value or ())
+    return 1
+
+
+def parse_entity_chunks(chunks, version, compact=False):
+    strings = StringTable(compact)
+    return [ChunkObjectParser(chunk, version, strings).parse() for chunk in chunks]
+
+
 class LevelParser(BinaryReader):
-    def __init__(self, filename):
+
+    """Reads the chunks of a level file.
+
+    parse() first indexes the (chunk_id, offset, chunk_length) of every
+    chunk in self.toc. Unless lazy is set, all chunks are then decoded
+    right away; with lazy=True a chunk type is decoded by the first get_*()
+    call that needs it and kept for later calls. A getter called before
+    parse() reads the chunk table first. A lazy parser keeps the
+    level data, so close() it only once all getters needed have run.
+
+    With workers set, entity chunks are decoded in batches of batch_size
+    on a process pool of that many workers, keeping the file order.
+
+    instrument, if given, is called with a ChunkEvent for every chunk and
+    mesh sub-chunk decoded, see parsers/instrumentation.py. Entity chunks
+    decoded on the process pool are not reported.
+
+    chunks and skip select the chunk types to decode by name, for example
+    chunks={"layers", "groups"} or skip={"entities", "mesh/triangles"}, see
+    chunk_selection(). Other chunks are stepped over without being read,
+    and their getters return empty values. With use_mmap, only the pages
+    holding chunk headers and selected chunks are read from disk.
+
+    strings is the StringTable interning the names of the entities, by
+    default the one of the process. Pass StringTable(compact=True) to get
+    entity properties with shared layouts, see parsers/stringtable.py.
+    Each batch decoded on the process pool has a table of its own.
+    """
+
+    def __init__(self, filename, use_mmap=False, vectorized=False, lazy=False, workers=None, batch_size=256,
+                 instrument=None, chunks=None, skip=None, strings=None):
         self.filename = filename
+        self.strings = strings
+        self.vectorized = vectorized
+        self.instrument = instrument
+        (self.selected, self.skipped, self.subchunks) = chunk_selection(chunks, skip)
+        self.lazy = lazy
+        self.workers = workers
+        self.batch_size = batch_size
+        self.version = None
+        self.toc = []
+        self.decoded = set()
+        self.mmap = None
         with io.open(self.filename, "rb") as f:
-            level_data = f.read()
+            if use_mmap and os.fstat(f.fileno()).st_size > 0:
+                # chunks are handed to the chunk parsers as views into the map
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                level_data = self.mmap
+            else:
+                level_data = f.read()
         super(LevelParser, self).__init__(level_data)
         self.elements = { 1:[], 2:[], 3:[], 4:[], 5:[], 6:[], 7:[] }
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Releases the level data. Views into a map that are still alive,
+        for example in the frames of a traceback, keep it open until they
+        are collected."""
+        try:
+            self.data.release()
+            if self.mmap is not None:
+                self.mmap.close()
+        except BufferError:
+            pass
+        self.mmap = None
+
     def parse(self):
+        self.read_toc()
+        if not self.lazy:
+            for (chunk_id, offset, chunk_length) in self.toc:
+                self.load_chunks(chunk_id)
+            self.decoded.update(self.elements)
+
+    def parse_magic_number(self):
+        return self.read_string(3)
+
+    def parse_version(self):
+        return self.read_unsigned_char8()
+
+    def parse_header(self):
         magicnumber = self.parse_magic_number()
         if magicnumber != "LVL":
             raise errors.TypeError("Error: file '%s' is not a level file" % (os.path.basename(self.filename)))
 
         self.version = self.parse_version()
-        print("Reading level \"" + self.filename +
-              "\" (version " + str(self.version) + ")")
+        logger.info("Reading level \"%s\" (version %d)", self.filename, self.version)
+
+    def read_toc(self):
+        self.fp = 0
+        self.parse_header()
+        self.toc = list(self.iter_toc())
 
+    def iter_toc(self):
         while not self.end():
-            try:
-                chunk_id = self.read_unsigned_int32()
-                chunk_length = self.read_unsigned_int32()
-                value = self.read_chunk(chunk_id, chunk_length)
-                if chunk_id in (2,3,5):
-                    self.elements[chunk_id] = value
-                else:
-                    if chunk_id not in self.elements:
-                        self.elements[chunk_id] = []
-                    self.elements[chunk_id].append(value)
-            except IOError as e:
-                raise
+            chunk_id = self.read_unsigned_int32()
+            chunk_length = self.read_unsigned_int32()
+            offset = self.fp
+            self.skip(chunk_length)
+            yield (chunk_id, offset, chunk_length)
 
-    def parse_magic_number(self):
-        return self.read_string(3)
+    def iter_entities(self, classnames=None):
+        """Yields the entities one at a time without storing them.
 
-    def parse_version(self):
-        return self.read_unsigned_char8()
+        If classnames is given, entities of other classes are skipped
+        before their properties are decoded. Before parse(), the chunk
+        table is read along the way and kept in self.toc once complete, so
+        the method can be called again.
+        """
+        if classnames is not None:
+            classnames = frozenset(classnames)
+        if not self.toc:
+            self.fp = 0
+            self.parse_header()
+            chunks = self.stream_toc()
+        else:
+            chunks = self.toc
+        for (chunk_id, offset, chunk_length) in chunks:
+            if chunk_id != 1:
+                continue
+            chunk = self.data[offset:offset+chunk_length]
+            entity = ChunkObjectParser(chunk, self.version, self.strings).parse(classnames)
+            if entity is not None:
+                yield entity
+
+    def stream_toc(self):
+        toc = []
+        for entry in self.iter_toc():
+            toc.append(entry)
+            yield entry
+        self.toc = toc
 
-    def read_chunk(self, chunk_id, chunk_length):
-        chunk_start = self.fp
-        chunk = self.read_bytes(chunk_length)
-        parser = ChunkParser(chunk_id, chunk, self.version)
-        value = parser.parse_chunk()
-        chunk_bytes_read = self.fp - chunk_start
-        chunk_bytes_left = chunk_length - chunk_bytes_read
-        if chunk_bytes_left != 0:
-            raise errors.ParseError("Error: read %d bytes, should be %d bytes" % (chunk_bytes_read, chunk_length))
-        return value
+    def read_chunk(self, chunk_id, offset, chunk_length):
+        chunk = self.data[offset:offset+chunk_length]
+        parser = ChunkParser(chunk_id, chunk, self.version, self.vectorized, self.instrument, self.subchunks,
+                             self.strings)
+        return measure(self.instrument, chunk_id, chunk_length, parser.parse_chunk,
+                       lambda value: chunk_count(chunk_id, value))
+
+    def store_chunk(self, chunk_id, value):
+        if chunk_id in (2,3,5):
+            self.elements[chunk_id] = value
+        else:
+            if chunk_id not in self.elements:
+                self.elements[chunk_id] = []
+            self.elements[chunk_id].append(value)
+
+    def load_chunks(self, chunk_id):
+        if chunk_id in self.decoded or not self.is_selected(chunk_id):
+            return
+        if not self.toc:
+            # a getter called before parse()
+            self.read_toc()
+        chunks = [(offset, chunk_length) for (toc_chunk_id, offset, chunk_length) in self.toc
+                  if toc_chunk_id == chunk_id]
+        if chunk_id == 1 and self.workers and len(chunks) > self.batch_size:
+            for entity in self.read_entities_parallel(chunks):
+                self.store_chunk(chunk_id, entity)
+        else:
+            for (offset, chunk_length) in chunks:
+                self.store_chunk(chunk_id, self.read_chunk(chunk_id, offset, chunk_length))
+        self.decoded.add(chunk_id)
+
+    def is_selected(self, chunk_id):
+        if chunk_id in self.skipped:
+            return False
+        return self.selected is None or chunk_id in self.selected
+
+    def read_entities_parallel(self, chunks):
+        batches = []
+        for i in range(0, len(chunks), self.batch_size):
+            batches.append([self.data[offset:offset+chunk_length].tobytes()
+                            for (offset, chunk_length) in chunks[i:i+self.batch_size]])
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            compact = self.strings is not None and self.strings.compact
+            for entities in executor.map(parse_entity_chunks, batches, repeat(self.version), repeat(compact)):
+                for entity in entities:
+                    yield entity
 
     def get_entities(self):
+        self.load_chunks(1)
         return self.elements[1]
 
     def get_mesh(self):
+        self.load_chunks(2)
         return self.elements[2]
 
     def get_layers(self):
+        self.load_chunks(3)
         return self.elements[3]
 
     def get_viewport(self):
+        self.load_chunks(4)
         return self.elements[4]
 
     def get_groups(self):
+        self.load_chunks(5)
         return self.elements[5]
 
     def get_customcolors(self):
+        self.load_chunks(6)
         return self.elements[6]
 
     def get_editorsettings(self):
-        return self.elements[7]
\ No newline at end of file
+        self.load_chunks(7)
+        return self.elements[7]
+
+
+def iter_entities(filename, classnames=None):
+    """Yields the entities of a level file one at a time, see
+    LevelParser.iter_entities()."""
+    with LevelParser(filename, use_mmap=True) as parser:
+        for entity in parser.iter_entities(classnames):
+            yield entity
@@ -0,0 +1,273 @@
+import numpy as np
+
+import errors
+
+
+# Packed record layouts of the fixed-size mesh sub-chunk entries
+VERTEX_DTYPE = np.dtype([("position", "<f4", (3,)), ("smoothing", "u1")])
+EDGE_DTYPE = np.dtype([("vertices", "<u4", (2,)), ("smooth", "u1")])
+VEC3_DTYPE = np.dtype(("<f4", (3,)))
+INDEX_DTYPE = np.dtype("<u4")
+
+
+def read_records(parser, dtype, count):
+    data = parser.read_bytes(count * dtype.itemsize)
+    return np.frombuffer(data, dtype, count)
+
+
+def read_vertices(parser):
+    num_vertices = parser.read_unsigned_int32()
+    records = read_records(parser, VERTEX_DTYPE, num_vertices)
+    positions = np.ascontiguousarray(records["position"])
+    smoothing = records["smoothing"].astype(bool)
+    return (positions, smoothing)
+
+
+def read_edges(parser):
+    num_edges = parser.read_unsigned_int32()
+    records = read_records(parser, EDGE_DTYPE, num_edges)
+    vertices = np.ascontiguousarray(records["vertices"])
+    smooth = records["smooth"].astype(bool)
+    return (vertices, smooth)
+
+
+def read_faces(parser):
+    """Reads a face chunk into face columns and CSR edge loops.
+
+    The chunk is made of 4 byte words only, so it is walked as words to
+    find where every face and edge loop starts, and the records are then
+    gathered with numpy in one go.
+    """
+    num_faces = parser.read_unsigned_int32()
+    data = parser.data[parser.fp:]
+    if len(data) % 4:
+        raise errors.ParseError("Error: face chunk length is not a multiple of 4")
+    words = data.cast("I")
+    face_starts = []
+    loop_starts = []
+    p = 0
+    try:
+        for i in range(num_faces):
+            face_starts.append(p)
+            num_loops = words[p + 7] + 1
+            p += 8
+            # border edge loop is always the first edge loop
+            for j in range(num_loops):
+                loop_starts.append(p)
+                p += 1 + 2 * words[p]
+    except IndexError:
+        raise errors.ParseError("Error: face chunk is truncated")
+    parser.skip(4 * p)
+
+    array = np.frombuffer(data, "<u4", p)
+    headers = array[np.array(face_starts, np.int64)[:, None] + np.arange(8)]
+    values = headers.view("<f4")
+    loop_starts = np.array(loop_starts, np.int64)
+    loop_lengths = array[loop_starts]
+    loop_offsets = csr_offsets(loop_lengths)
+    edge_words = np.repeat(loop_starts + 1 - 2 * loop_offsets[:-1], loop_lengths) + 2 * np.arange(loop_offsets[-1])
+    loop_edges = np.empty((loop_offsets[-1], 2), np.uint32)
+    loop_edges[:, 0] = array[edge_words + 1]
+    loop_edges[:, 1] = array[edge_words] != 0
+    faces = {
+        "angles": values[:, 0].copy(),
+        "offsets": values[:, 1:3].copy(),
+        "scales": values[:, 3:5].copy(),
+        "mapping_groups": headers[:, 5].copy(),
+        "materials": headers[:, 6].copy(),
+        "loop_offsets": csr_offsets(headers[:, 7] + 1),
+        "edge_offsets": loop_offsets,
+        "edges": loop_edges
+    }
+    return faces
+
+
+def csr_offsets(counts):
+    """Returns the CSR offsets, len(counts) + 1 of them, for counts"""
+    result = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(counts, out=result[1:])
+    return result
+
+
+def read_triangles(parser):
+    """Reads a triangle chunk. The triangles of face i are the rows
+    face_offsets[i] up to face_offsets[i + 1] of triangles."""
+    num_ghost_vertices = parser.read_unsigned_int32()
+    ghost_vertices = read_records(parser, VEC3_DTYPE, num_ghost_vertices).copy()
+    num_smoothed_normals = parser.read_unsigned_int32()
+    smoothed_normals = read_records(parser, VEC3_DTYPE, num_smoothed_normals).copy()
+    num_faces = parser.read_unsigned_int32()
+    num_triangles = parser.read_unsigned_int32()
+    data = parser.data[parser.fp:]
+    if len(data) % 4:
+        raise errors.ParseError("Error: triangle chunk length is not a multiple of 4")
+    # every face is a triangle count followed by 6 words per triangle
+    words = data.cast("I")
+    count_starts = []
+    p = 0
+    try:
+        for i in range(num_faces):
+            count_starts.append(p)
+            p += 1 + 6 * words[p]
+    except IndexError:
+        raise errors.ParseError("Error: triangle chunk is truncated")
+    parser.skip(4 * p)
+    array = np.frombuffer(data, "<u4", p)
+    count_starts = np.array(count_starts, np.int64)
+    counts = array[count_starts]
+    face_offsets = csr_offsets(counts)
+    is_triangle = np.ones(p, bool)
+    is_triangle[count_starts] = False
+    triangles = array[is_triangle].reshape(-1, 6)
+    return (ghost_vertices, smoothed_normals, triangles, face_offsets, num_triangles)
+
+
+def read_facelayers(parser):
+    """Reads a face layer chunk into the number of layer bit value words of
+    every face, 0 for faces without layers, and an (F, W) uint32 matrix of
+    the words padded with zeros."""
+    num_faces = parser.read_unsigned_int32()
+    format = parser.read_unsigned_int32()
+    if format != 2:
+        raise errors.ParseError("Error: format is not 2")
+    data = parser.data[parser.fp:]
+    if len(data) % 4:
+        raise errors.ParseError("Error: face layer chunk length is not a multiple of 4")
+    words = data.cast("I")
+    word_starts = []
+    counts = []
+    p = 0
+    try:
+        for i in range(num_faces):
+            if words[p]:
+                count = words[p + 1]
+                word_starts.append(p + 2)
+                counts.append(count)
+                p += 2 + count
+            else:
+                word_starts.append(p + 1)
+                counts.append(0)
+                p += 1
+    except IndexError:
+        raise errors.ParseError("Error: face layer chunk is truncated")
+    parser.skip(4 * p)
+    array = np.frombuffer(data, "<u4", p)
+    counts = np.array(counts, np.uint32)
+    offsets = csr_offsets(counts)
+    bits = np.zeros((num_faces, counts.max() if num_faces else 0), np.uint32)
+    rows = np.repeat(np.arange(num_faces), counts)
+    columns = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    bits[rows, columns] = array[np.repeat(np.array(word_starts, np.int64), counts) + columns]
+    return (counts, bits)
+
+
+def read_geometrygroups(parser):
+    """Reads the vertex, edge and face groups of a geometry group chunk.
+
+    Returns an (ids, offsets, indices) triple per kind, the indices of
+    group ids[i] are indices[offsets[i]:offsets[i + 1]], in file order so
+    that the chunk is written back unchanged.
+    """
+    groups = []
+    for kind in range(3):
+        num_groups = parser.read_unsigned_int32()
+        ids = np.empty(num_groups, np.uint32)
+        counts = np.empty(num_groups, np.uint32)
+        blocks = []
+        for i in range(num_groups):
+            ids[i] = parser.read_unsigned_int32()
+            counts[i] = parser.read_unsigned_int32()
+            blocks.append(read_records(parser, INDEX_DTYPE, counts[i]))
+        # the blocks of the groups follow each other, already grouped by owner
+        indices = np.concatenate(blocks).astype(np.uint32) if blocks else np.empty(0, np.uint32)
+        groups.append((ids, csr_offsets(counts), indices))
+    return groups
+
+
+def vertex_records(positions, smoothing):
+    records = np.empty(len(positions), VERTEX_DTYPE)
+    records["position"] = positions
+    records["smoothing"] = smoothing
+    return records.tobytes()
+
+
+def edge_records(vertices, smooth):
+    records = np.empty(len(vertices), EDGE_DTYPE)
+    records["vertices"] = vertices
+    records["smooth"] = smooth
+    return records.tobytes()
+
+
+def face_records(angles, offsets, scales, mapping_groups, materials, loop_offsets, edge_offsets, edges):
+    """Encodes the faces of a face chunk and their CSR edge loops as one
+    block, the reverse of read_faces()."""
+    num_faces = len(angles)
+    num_loops = len(edge_offsets) - 1
+    loops_per_face = np.diff(loop_offsets)
+    loop_faces = np.repeat(np.arange(num_faces), loops_per_face)
+    loop_starts = 8 * (loop_faces + 1) + np.arange(num_loops) + 2 * edge_offsets[:-1]
+    face_starts = 8 * np.arange(num_faces) + loop_offsets[:-1] + 2 * edge_offsets[loop_offsets[:-1]]
+    records = np.empty(8 * num_faces + num_loops + 2 * len(edges), "<u4")
+
+    headers = np.empty((num_faces, 8), "<u4")
+    values = headers.view("<f4")
+    values[:, 0] = angles
+    values[:, 1:3] = offsets
+    values[:, 3:5] = scales
+    headers[:, 5] = mapping_groups
+    headers[:, 6] = materials
+    headers[:, 7] = loops_per_face - 1
+    records[face_starts[:, None] + np.arange(8)] = headers
+
+    loop_lengths = np.diff(edge_offsets)
+    records[loop_starts] = loop_lengths
+    edge_words = np.repeat(loop_starts + 1 - 2 * edge_offsets[:-1], loop_lengths) + 2 * np.arange(len(edges))
+    records[edge_words] = edges[:, 1]
+    records[edge_words + 1] = edges[:, 0]
+    return records.tobytes()
+
+
+def triangle_records(triangles, face_offsets):
+    """Encodes the per-face triangle lists of a triangle chunk, each a
+    triangle count followed by its (vi_1, vi_2, vi_3, sni_1, sni_2, sni_3)
+    rows, as one block."""
+    face_offsets = np.asarray(face_offsets, np.int64)
+    triangles = np.asarray(triangles, np.uint32).reshape(-1, 6)
+    count_positions = np.arange(len(face_offsets) - 1) + 6 * face_offsets[:-1]
+    records = np.empty(len(face_offsets) - 1 + triangles.size, "<u4")
+    is_count = np.zeros(len(records), bool)
+    is_count[count_positions] = True
+    records[count_positions] = np.diff(face_offsets)
+    records[~is_count] = triangles.ravel()
+    return records.tobytes()
+
+
+def facelayer_records(counts, bits):
+    """Encodes the faces of a face layer chunk, the reverse of
+    read_facelayers()."""
+    counts = np.asarray(counts, np.int64)
+    num_faces = len(counts)
+    has_layers = counts > 0
+    lengths = np.where(has_layers, 2 + counts, 1)
+    starts = csr_offsets(lengths)[:-1]
+    records = np.empty(lengths.sum(), "<u4")
+    records[starts] = has_layers
+    records[starts[has_layers] + 1] = counts[has_layers]
+    offsets = csr_offsets(counts)
+    rows = np.repeat(np.arange(num_faces), counts)
+    columns = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    records[np.repeat(starts + 2, counts) + columns] = bits[rows, columns]
+    return records.tobytes()
+
+
+def geometrygroup_records(ids, offsets, indices):
+    """Encodes the groups of one kind of a geometry group chunk"""
+    counts = np.diff(offsets)
+    lengths = 2 + counts
+    starts = csr_offsets(lengths)[:-1]
+    records = np.empty(1 + lengths.sum(), "<u4")
+    records[0] = len(ids)
+    records[1 + starts] = ids
+    records[2 + starts] = counts
+    records[np.repeat(3 + starts - offsets[:-1], counts) + np.arange(len(indices))] = indices
+    return records.tobytes()
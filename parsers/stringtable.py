@@ -0,0 +1,83 @@
+import sys
+from collections.abc import Mapping
+
+
+class EntityProperties(Mapping):
+
+    """Read-only properties of an entity stored against a shared layout.
+
+    layout maps the property names to their position in values and is
+    shared by every entity decoded with the same property names, which
+    the entities of a classname usually are.
+    """
+
+    __slots__ = ("layout", "values")
+
+    def __init__(self, layout, values):
+        self.layout = layout
+        self.values = values
+
+    def __getitem__(self, name):
+        return self.values[self.layout[name]]
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    def get(self, name, default=None):
+        index = self.layout.get(name)
+        return default if index is None else self.values[index]
+
+    def __iter__(self):
+        return iter(self.layout)
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class StringTable(object):
+
+    """Interns the classnames and property names of decoded entities.
+
+    Names are looked up by their raw bytes, so a name already seen is not
+    decoded again, and every entity holds the same str object for it. With
+    compact set, the parser also returns the properties of entities as
+    EntityProperties sharing one layout per distinct list of names instead
+    of a dict each.
+    """
+
+    def __init__(self, compact=False):
+        self.compact = compact
+        self.strings = {}
+        self.layouts = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def string(self, data):
+        """Returns the interned str of the utf-8 encoded data"""
+        try:
+            return self.strings[data]
+        except KeyError:
+            pass
+        except ValueError:
+            # views of writable buffers are not hashable
+            data = bytes(data)
+            if data in self.strings:
+                return self.strings[data]
+        string = sys.intern(str(data, "utf-8"))
+        self.strings[bytes(data)] = string
+        return string
+
+    def layout(self, names):
+        """Returns the shared {name: index} layout of a tuple of names"""
+        layout = self.layouts.get(names)
+        if layout is None:
+            layout = self.layouts[names] = dict((name, index) for index, name in enumerate(names))
+        return layout
+
+
+# table used by the parsers when none is given
+STRINGS = StringTable()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parsers.levelparser import LevelParser, CHUNK_NAMES
+
+
+def find_levels(directory):
+    """Returns the paths of all .level files below directory, sorted"""
+    levels = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".level"):
+                levels.append(os.path.join(root, name))
+    return levels
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: %s" % (value))
+    return number
+
+
+def scan_level(filename):
+    """Parses a level file and returns its summary record"""
+    record = {
+        "file": filename,
+        "size": None,
+        "version": None,
+        "chunks": {},
+        "counts": {},
+        "error": None,
+        "parse_time": None
+    }
+    start = time.time()
+    try:
+        record["size"] = os.path.getsize(filename)
+        with LevelParser(filename, use_mmap=True) as parser:
+            parser.parse()
+            record["version"] = parser.version
+            for (chunk_id, offset, chunk_length) in parser.toc:
+                name = CHUNK_NAMES.get(chunk_id, str(chunk_id))
+                record["chunks"][name] = record["chunks"].get(name, 0) + chunk_length
+            record["counts"] = level_counts(parser)
+    except Exception as e:
+        record["error"] = "%s: %s" % (type(e).__name__, e)
+    record["parse_time"] = time.time() - start
+    return record
+
+
+def level_counts(parser):
+    mesh = parser.get_mesh()
+    counts = {
+        "entities": len(parser.get_entities()),
+        "layers": len(parser.get_layers() or ()),
+        "groups": len(parser.get_groups() or ())
+    }
+    if mesh:
+        counts["materials"] = len(mesh["materials"])
+        counts["vertices"] = len(mesh["vertices"])
+        counts["edges"] = len(mesh["edges"])
+        counts["faces"] = len(mesh["faces"])
+        if mesh["triangles"]:
+            counts["triangles"] = mesh["triangles"]["total"]
+    return counts
+
+
+def scan(directory, jobs=None, output=sys.stdout):
+    """Scans every level below directory on jobs worker processes and
+    writes one JSON record per level to output. Returns the number of
+    levels that failed to parse."""
+    levels = find_levels(directory)
+    failed = 0
+    if jobs == 1:
+        records = map(scan_level, levels)
+        failed = write_records(records, output)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            records = executor.map(scan_level, levels, chunksize=4)
+            failed = write_records(records, output)
+    return failed
+
+
+def write_records(records, output):
+    failed = 0
+    for record in records:
+        if record["error"] is not None:
+            failed += 1
+        output.write(json.dumps(record, sort_keys=True) + "\n")
+        output.flush()
+    return failed
+
+
+def main(args):
+    argparser = argparse.ArgumentParser(prog="ns2lr.py scan",
+                                        description="Parses every .level file below DIR.")
+    argparser.add_argument("directory", metavar="DIR")
+    argparser.add_argument("--jobs", "-j", type=positive_int, default=None,
+                           help="number of worker processes (default: number of CPUs)")
+    argparser.add_argument("--output", "-o", default="-",
+                           help="file for the JSON lines summary (default: stdout)")
+    options = argparser.parse_args(args)
+
+    if not os.path.isdir(options.directory):
+        sys.exit("Error: directory %s was not found!" % (options.directory))
+
+    if options.output == "-":
+        failed = scan(options.directory, options.jobs, sys.stdout)
+    else:
+        with io.open(options.output, "w") as output:
+            failed = scan(options.directory, options.jobs, output)
+    return 1 if failed else 0
@@ -0,0 +1,225 @@
+import numpy as np
+
+
+def morton_codes(points):
+    """Returns 30 bit Morton codes of points within their bounding box"""
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-9)
+    cells = np.clip(((points - lo) / extent * 1023.0).astype(np.uint32), 0, 1023)
+    codes = np.zeros(len(points), np.uint32)
+    for axis in range(3):
+        # spread the 10 bits of the cell index 3 bits apart
+        v = cells[:, axis]
+        v = (v * np.uint32(0x00010001)) & np.uint32(0xFF0000FF)
+        v = (v * np.uint32(0x00000101)) & np.uint32(0x0F00F00F)
+        v = (v * np.uint32(0x00000011)) & np.uint32(0xC30C30C3)
+        v = (v * np.uint32(0x00000005)) & np.uint32(0x49249249)
+        codes |= v << np.uint32(2 - axis)
+    return codes
+
+
+def dot(a, b):
+    return np.einsum("ij,ij->i", a, b)
+
+
+def closest_points_on_triangles(p, a, b, c):
+    """Returns the closest point to p[i] on every triangle (a[i], b[i], c[i])"""
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    d1 = dot(ab, ap)
+    d2 = dot(ac, ap)
+    d3 = dot(ab, bp)
+    d4 = dot(ac, bp)
+    d5 = dot(ab, cp)
+    d6 = dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = 1.0 / (va + vb + vc)
+        result = a + ab * (vb * denom)[:, None] + ac * (vc * denom)[:, None]
+        # Voronoi regions of the edges and corners, later ones take precedence
+        regions = [
+            ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0), b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[:, None]),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), a + ac * (d2 / (d2 - d6))[:, None]),
+            ((d6 >= 0) & (d5 <= d6), c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), a + ab * (d1 / (d1 - d3))[:, None]),
+            ((d3 >= 0) & (d4 <= d3), b),
+            ((d1 <= 0) & (d2 <= 0), a)
+        ]
+    for (mask, point) in regions:
+        result[mask] = point[mask]
+    return result
+
+
+class TriangleBVH(object):
+
+    """Bounding volume hierarchy over the triangles of a mesh.
+
+    Triangles are sorted along a Morton curve of their centroids and put
+    leaf_size at a time into the leaves of a complete binary tree, so the
+    build is one sort plus a pass per tree level. The tree is stored
+    implicitly: levels[d] holds the (lo, hi) bounds of the 2**d nodes at
+    depth d, and the children of node k are 2k and 2k + 1.
+
+    Queries take batches of rays, points or boxes and walk the tree one
+    level at a time for the whole batch, keeping the (query, node) pairs
+    that can still matter.
+    """
+
+    def __init__(self, points, triangles, leaf_size=4):
+        self.points = np.asarray(points, np.float64).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, np.int64).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        corners = self.points[self.triangles]
+        num_triangles = len(self.triangles)
+        num_leaves = max(1, -(-num_triangles // leaf_size))
+        self.depth = int(np.ceil(np.log2(num_leaves)))
+        size = (1 << self.depth) * leaf_size
+
+        order = np.argsort(morton_codes(corners.mean(axis=1)), kind="stable") if num_triangles else []
+        self.leaf_triangles = np.full(size, -1, np.int64)
+        self.leaf_triangles[:num_triangles] = order
+        self.triangle_lo = np.full((size, 3), np.inf)
+        self.triangle_hi = np.full((size, 3), -np.inf)
+        if num_triangles:
+            self.triangle_lo[:num_triangles] = corners.min(axis=1)[order]
+            self.triangle_hi[:num_triangles] = corners.max(axis=1)[order]
+
+        lo = self.triangle_lo.reshape(-1, leaf_size, 3).min(axis=1)
+        hi = self.triangle_hi.reshape(-1, leaf_size, 3).max(axis=1)
+        self.levels = [(lo, hi)]
+        while len(lo) > 1:
+            lo = lo.reshape(-1, 2, 3).min(axis=1)
+            hi = hi.reshape(-1, 2, 3).max(axis=1)
+            self.levels.append((lo, hi))
+        self.levels.reverse()
+
+    @classmethod
+    def from_mesh(cls, mesh, leaf_size=4):
+        """Builds the hierarchy over the triangles of a MeshArrays. Vertex
+        indices past the mesh vertices refer to its ghost vertices."""
+        points = np.concatenate((mesh.positions, mesh.ghost_vertices))
+        return cls(points, mesh.vertex_indices(), leaf_size)
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def walk(self, pairs, keep):
+        """Walks (query, node) pairs from the root down to the leaves.
+
+        keep(queries, depth, nodes) returns which pairs to descend into.
+        Returns the (query, triangle) pairs of the leaves reached.
+        """
+        (queries, nodes) = pairs
+        for depth in range(self.depth + 1):
+            (lo, hi) = self.levels[depth]
+            # empty padding nodes have lo > hi
+            mask = (lo[nodes, 0] <= hi[nodes, 0]) & keep(queries, depth, nodes)
+            (queries, nodes) = (queries[mask], nodes[mask])
+            if depth < self.depth:
+                queries = np.repeat(queries, 2)
+                nodes = (np.repeat(nodes, 2) << 1) | np.tile([0, 1], len(nodes))
+        slots = (nodes[:, None] * self.leaf_size + np.arange(self.leaf_size)).ravel()
+        queries = np.repeat(queries, self.leaf_size)
+        triangles = self.leaf_triangles[slots]
+        mask = triangles >= 0
+        return (queries[mask], slots[mask], triangles[mask])
+
+    def root_pairs(self, count):
+        return (np.arange(count), np.zeros(count, np.int64))
+
+    def ray_cast(self, origins, directions, max_distance=np.inf):
+        """Casts rays and returns (t, triangle) per ray, the ray parameter
+        and index of the nearest triangle hit, or (inf, -1) on a miss.
+        Hits are points origin + t * direction with 0 <= t <= max_distance.
+        """
+        origins = np.asarray(origins, np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, np.float64).reshape(-1, 3)
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / directions
+
+        def keep(queries, depth, nodes):
+            (lo, hi) = self.levels[depth]
+            o = origins[queries]
+            inv = inverse[queries]
+            with np.errstate(invalid="ignore"):
+                t1 = (lo[nodes] - o) * inv
+                t2 = (hi[nodes] - o) * inv
+            t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            return (t_far >= np.maximum(t_near, 0.0)) & (t_near <= max_distance)
+
+        (queries, slots, triangles) = self.walk(self.root_pairs(len(origins)), keep)
+        t = self.intersect(origins[queries], directions[queries], triangles)
+        t[(t < 0) | (t > max_distance)] = np.inf
+        nearest = np.full(len(origins), np.inf)
+        np.minimum.at(nearest, queries, t)
+        hit = np.full(len(origins), -1, np.int64)
+        is_nearest = np.isfinite(t) & (t == nearest[queries])
+        hit[queries[is_nearest]] = triangles[is_nearest]
+        return (nearest, hit)
+
+    def intersect(self, origins, directions, triangles):
+        """Moeller-Trumbore ray/triangle test, returns t or inf per pair"""
+        (a, b, c) = self.points[self.triangles[triangles]].transpose(1, 0, 2)
+        e1 = b - a
+        e2 = c - a
+        p = np.cross(directions, e2)
+        det = dot(e1, p)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_det = 1.0 / det
+            s = origins - a
+            u = dot(s, p) * inv_det
+            q = np.cross(s, e1)
+            v = dot(directions, q) * inv_det
+            t = dot(e2, q) * inv_det
+            hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1)
+        return np.where(hit, t, np.inf)
+
+    def closest_points(self, points):
+        """Returns (distance, triangle, closest point) per query point"""
+        points = np.asarray(points, np.float64).reshape(-1, 3)
+        bound = np.full(len(points), np.inf)
+
+        def keep(queries, depth, nodes):
+            (lo, hi) = self.levels[depth]
+            p = points[queries]
+            near = np.sqrt((np.maximum(np.maximum(lo[nodes] - p, p - hi[nodes]), 0.0) ** 2).sum(axis=1))
+            # every non-empty box holds a triangle no farther than its
+            # farthest corner
+            far = np.sqrt((np.maximum(np.abs(p - lo[nodes]), np.abs(p - hi[nodes])) ** 2).sum(axis=1))
+            valid = lo[nodes, 0] <= hi[nodes, 0]
+            np.minimum.at(bound, queries[valid], far[valid])
+            return near <= bound[queries]
+
+        (queries, slots, triangles) = self.walk(self.root_pairs(len(points)), keep)
+        (a, b, c) = self.points[self.triangles[triangles]].transpose(1, 0, 2)
+        closest = closest_points_on_triangles(points[queries], a, b, c)
+        distances = np.sqrt(((closest - points[queries]) ** 2).sum(axis=1))
+        nearest = np.full(len(points), np.inf)
+        np.minimum.at(nearest, queries, distances)
+        is_nearest = distances == nearest[queries]
+        hit = np.full(len(points), -1, np.int64)
+        result = np.full((len(points), 3), np.nan)
+        hit[queries[is_nearest]] = triangles[is_nearest]
+        result[queries[is_nearest]] = closest[is_nearest]
+        return (nearest, hit, result)
+
+    def overlapping(self, lo, hi):
+        """Returns (query, triangle) index pairs of the triangles whose
+        bounds overlap the query boxes lo[i], hi[i]"""
+        box_lo = np.asarray(lo, np.float64).reshape(-1, 3)
+        box_hi = np.asarray(hi, np.float64).reshape(-1, 3)
+
+        def keep(queries, depth, nodes):
+            (lo, hi) = self.levels[depth]
+            return ((lo[nodes] <= box_hi[queries]) & (hi[nodes] >= box_lo[queries])).all(axis=1)
+
+        (queries, slots, triangles) = self.walk(self.root_pairs(len(box_lo)), keep)
+        mask = ((self.triangle_lo[slots] <= box_hi[queries]) &
+                (self.triangle_hi[slots] >= box_lo[queries])).all(axis=1)
+        return (queries[mask], triangles[mask])
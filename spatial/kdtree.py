@@ -0,0 +1,163 @@
+import heapq
+
+import numpy as np
+
+
+class KDTree(object):
+
+    """Balanced k-d tree over a set of points.
+
+    The tree is stored implicitly in the order array: the points of a
+    node's range are order[lo:hi], its splitting point is order[m] with
+    m = (lo + hi) // 2 and axes[m] the splitting axis, and its children
+    are the ranges [lo, m) and [m + 1, hi). Ranges of at most leaf_size
+    points are leaves and are searched with numpy.
+    """
+
+    def __init__(self, points, leaf_size=16):
+        self.points = np.asarray(points, np.float64)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        self.axes = np.zeros(len(self.points), np.int8)
+        stack = [(0, len(self.points))]
+        while stack:
+            (lo, hi) = stack.pop()
+            if hi - lo <= leaf_size:
+                continue
+            indices = self.order[lo:hi]
+            values = self.points[indices]
+            axis = int(np.argmax(values.max(axis=0) - values.min(axis=0)))
+            m = (lo + hi) // 2
+            self.order[lo:hi] = indices[np.argpartition(values[:, axis], m - lo)]
+            self.axes[m] = axis
+            stack.append((lo, m))
+            stack.append((m + 1, hi))
+
+    def __len__(self):
+        return len(self.points)
+
+    def within(self, point, radius):
+        """Returns the indices of the points within radius of point"""
+        point = np.asarray(point, np.float64)
+        found = []
+        stack = [(0, len(self.points))]
+        while stack:
+            (lo, hi) = stack.pop()
+            if hi - lo <= self.leaf_size:
+                indices = self.order[lo:hi]
+                distances = ((self.points[indices] - point) ** 2).sum(axis=1)
+                found.append(indices[distances <= radius * radius])
+                continue
+            m = (lo + hi) // 2
+            index = self.order[m]
+            axis = self.axes[m]
+            diff = point[axis] - self.points[index, axis]
+            if ((self.points[index] - point) ** 2).sum() <= radius * radius:
+                found.append(self.order[m:m + 1])
+            if diff <= radius:
+                stack.append((lo, m))
+            if diff >= -radius:
+                stack.append((m + 1, hi))
+        if not found:
+            return np.empty(0, np.int64)
+        return np.sort(np.concatenate(found))
+
+    def nearest(self, point, k=1):
+        """Returns (distances, indices) of the k points nearest to point,
+        nearest first"""
+        point = np.asarray(point, np.float64)
+        # max-heap of the best k as (-squared distance, index)
+        best = []
+        stack = [(0, len(self.points), 0.0)]
+        while stack:
+            (lo, hi, bound) = stack.pop()
+            if len(best) == k and bound > -best[0][0]:
+                continue
+            if hi - lo <= self.leaf_size:
+                indices = self.order[lo:hi]
+                distances = ((self.points[indices] - point) ** 2).sum(axis=1)
+                for (distance, index) in zip(distances, indices):
+                    self.push(best, k, distance, index)
+                continue
+            m = (lo + hi) // 2
+            index = self.order[m]
+            axis = self.axes[m]
+            diff = point[axis] - self.points[index, axis]
+            self.push(best, k, ((self.points[index] - point) ** 2).sum(), index)
+            (near, far) = (((lo, m), (m + 1, hi)) if diff <= 0 else ((m + 1, hi), (lo, m)))
+            # the far side is at least diff away on the splitting axis
+            stack.append(far + (max(bound, diff * diff),))
+            stack.append(near + (bound,))
+        best.sort(reverse=True)
+        return (np.sqrt([-distance for (distance, index) in best]),
+                np.array([index for (distance, index) in best], np.int64))
+
+    def push(self, best, k, distance, index):
+        if len(best) < k:
+            heapq.heappush(best, (-distance, index))
+        elif distance < -best[0][0]:
+            heapq.heapreplace(best, (-distance, index))
+
+
+class EntityIndex(object):
+
+    """Index over the origins of the entities of a level.
+
+    Entities without a three component origin are left out. A tree over
+    all entities is built right away, trees per classname on first use.
+    """
+
+    def __init__(self, entities, leaf_size=16):
+        self.entities = []
+        origins = []
+        for entity in entities:
+            origin = entity["properties"].get("origin")
+            if isinstance(origin, tuple) and len(origin) == 3:
+                self.entities.append(entity)
+                origins.append(origin)
+        self.origins = np.array(origins, np.float64).reshape(-1, 3)
+        self.classnames = np.array([entity["classname"] for entity in self.entities], object)
+        self.leaf_size = leaf_size
+        self.tree = KDTree(self.origins, leaf_size)
+        self.class_trees = {}
+
+    def __len__(self):
+        return len(self.entities)
+
+    def class_tree(self, classname):
+        """Returns (tree, entity indices) of the entities of classname"""
+        if classname not in self.class_trees:
+            members = np.flatnonzero(self.classnames == classname)
+            self.class_trees[classname] = (KDTree(self.origins[members], self.leaf_size), members)
+        return self.class_trees[classname]
+
+    def trees(self, classnames):
+        if classnames is None:
+            return [(self.tree, None)]
+        if isinstance(classnames, str):
+            classnames = (classnames,)
+        return [self.class_tree(classname) for classname in classnames]
+
+    def within(self, point, radius, classnames=None):
+        """Returns the entities within radius of point, in level order"""
+        found = []
+        for (tree, members) in self.trees(classnames):
+            indices = tree.within(point, radius)
+            found.append(indices if members is None else members[indices])
+        indices = np.sort(np.concatenate(found)) if found else []
+        return [self.entities[i] for i in indices]
+
+    def nearest(self, point, k=1, classnames=None):
+        """Returns (distance, entity) of the k entities nearest to point"""
+        distances = []
+        indices = []
+        for (tree, members) in self.trees(classnames):
+            (tree_distances, tree_indices) = tree.nearest(point, k)
+            distances.append(tree_distances)
+            indices.append(tree_indices if members is None else members[tree_indices])
+        if not distances:
+            return []
+        distances = np.concatenate(distances)
+        indices = np.concatenate(indices)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(distances[i], self.entities[indices[i]]) for i in order]
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.levelgen import LevelGenerator
+from elements.Elements import ChunkEntity
+from parsers.levelparser import LevelParser
+from parsers.stringtable import StringTable
+
+
+class ChunkEntityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ns2lr-test-")
+        self.filename = os.path.join(self.directory, "test.level")
+        LevelGenerator(100, 20).write(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_round_trip(self, strings):
+        with LevelParser(self.filename, lazy=True, strings=strings) as parser:
+            parser.parse()
+            chunks = [bytes(parser.data[offset:offset+chunk_length])
+                      for (chunk_id, offset, chunk_length) in parser.toc if chunk_id == 1]
+            entities = parser.get_entities()
+        self.assertEqual(len(entities), 20)
+        for (entity, chunk) in zip(entities, chunks):
+            self.assertEqual(ChunkEntity(entity).dump()[8:], chunk)
+
+    def test_round_trip(self):
+        self.check_round_trip(StringTable())
+
+    def test_round_trip_compact(self):
+        self.check_round_trip(StringTable(compact=True))
+
+    def test_property_type_inferred_without_types(self):
+        entity = {
+            "classname": "light",
+            "groupid": 0,
+            "layerdata": {},
+            "is_animated": False,
+            "properties": {"intensity": 2.5}
+        }
+        data = ChunkEntity(entity).dump()
+        with open(self.filename, "wb") as f:
+            f.write(b"LVL\x0a" + data)
+        with LevelParser(self.filename) as parser:
+            parser.parse()
+            (decoded,) = parser.get_entities()
+        self.assertEqual(decoded["properties"], {"intensity": 2.5})
+        self.assertEqual(decoded["property_types"], {"intensity": (2, 1, 0)})
+
+
+if __name__ == "__main__":
+    unittest.main()
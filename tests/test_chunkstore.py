@@ -0,0 +1,65 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.levelgen import LevelGenerator
+from chunkstore import ChunkStore
+from levelpatcher import LevelPatcher
+
+
+def add(directory, filename, name):
+    return ChunkStore(directory).add(filename, name)
+
+
+class ChunkStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ns2lr-test-")
+        self.store_directory = os.path.join(self.directory, "store")
+        self.filename = os.path.join(self.directory, "test.level")
+        LevelGenerator(200, 10).write(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        with io.open(filename, "rb") as f:
+            return f.read()
+
+    def test_revisions(self):
+        store = ChunkStore(self.store_directory)
+        revisions = [self.read(self.filename)]
+        self.assertEqual(store.add(self.filename), 0)
+        pack_size = os.path.getsize(store.pack_path)
+        patcher = LevelPatcher(self.filename)
+        patcher.set_property(patcher.entities()[0][0], "model", "changed.model")
+        patcher.write()
+        revisions.append(self.read(self.filename))
+        self.assertEqual(store.add(self.filename), 1)
+        # only the changed entity chunk is added
+        self.assertLess(os.path.getsize(store.pack_path) - pack_size, 1000)
+        for (revision, data) in enumerate(revisions):
+            self.assertEqual(store.get("test", revision), data)
+        self.assertEqual(store.get("test"), revisions[-1])
+
+    def test_concurrent_adds(self):
+        other = os.path.join(self.directory, "other.level")
+        LevelGenerator(300, 5).write(other)
+        jobs = [(self.filename, "test"), (other, "other")] * 4
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(add, self.store_directory, filename, name) for (filename, name) in jobs]
+            revisions = sorted((name, future.result()) for ((filename, name), future) in zip(jobs, futures))
+        self.assertEqual(revisions, sorted((name, i) for name in ("test", "other") for i in range(4)))
+        store = ChunkStore(self.store_directory)
+        for revision in range(4):
+            self.assertEqual(store.get("test", revision), self.read(self.filename))
+            self.assertEqual(store.get("other", revision), self.read(other))
+        self.assertEqual(os.path.getsize(store.pack_path),
+                         sum(length for (offset, length) in store.read_index().values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.levelgen import LevelGenerator
+from parsers.levelparser import LevelParser
+
+
+class LevelParserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ns2lr-test-")
+        self.filename = os.path.join(self.directory, "test.level")
+        LevelGenerator(100, 10).write(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lazy_getter_before_parse(self):
+        with LevelParser(self.filename, use_mmap=True, lazy=True) as parser:
+            self.assertEqual(len(parser.get_entities()), 10)
+            self.assertTrue(parser.toc)
+            parser.parse()
+            self.assertEqual(len(parser.get_entities()), 10)
+
+    def test_lazy_matches_eager(self):
+        with LevelParser(self.filename) as parser:
+            parser.parse()
+            entities = parser.get_entities()
+        with LevelParser(self.filename, lazy=True) as parser:
+            parser.parse()
+            self.assertEqual(parser.get_entities(), entities)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.levelgen import LevelGenerator
+from levelpatcher import LevelPatcher
+from parsers.levelparser import LevelParser
+
+
+def read_entities(filename):
+    with LevelParser(filename) as parser:
+        parser.parse()
+        return parser.get_entities()
+
+
+class LevelPatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ns2lr-test-")
+        self.filename = os.path.join(self.directory, "test.level")
+        LevelGenerator(400, 10).write(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_without_patches_is_identical(self):
+        with open(self.filename, "rb") as f:
+            original = f.read()
+        LevelPatcher(self.filename).write()
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), original)
+
+    def test_patch_and_write_twice(self):
+        patcher = LevelPatcher(self.filename)
+        (first, second) = [index for (index, entity) in patcher.entities()[:2]]
+        # a longer value moves every chunk after the first entity
+        patcher.set_property(first, "model", "models/a/much/longer/path/than/before.model")
+        patcher.write()
+        patcher.set_property(second, "model", "x.model")
+        patcher.write()
+        entities = read_entities(self.filename)
+        self.assertEqual(entities[0]["properties"]["model"], "models/a/much/longer/path/than/before.model")
+        self.assertEqual(entities[1]["properties"]["model"], "x.model")
+        self.assertEqual(len(entities), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.levelgen import LevelGenerator
+from levelreader import LevelReader
+
+
+class LevelReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="ns2lr-test-")
+        self.filename = os.path.join(self.directory, "test.level")
+        self.output = os.path.join(self.directory, "output.level")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        with io.open(filename, "rb") as f:
+            return f.read()
+
+    def test_round_trip(self):
+        LevelGenerator(200, 10).write(self.filename)
+        for vectorized in (False, True):
+            reader = LevelReader(vectorized=vectorized)
+            reader.read_level(self.filename)
+            reader.write_level(self.output)
+            self.assertEqual(self.read(self.output), self.read(self.filename))
+
+    def test_header_only_level(self):
+        with io.open(self.filename, "wb") as f:
+            f.write(b"LVL\x0a")
+        for vectorized in (False, True):
+            reader = LevelReader(vectorized=vectorized)
+            reader.read_level(self.filename)
+            self.assertIsNone(reader.mesh)
+            reader.write_level(self.output)
+            self.assertEqual(self.read(self.output), b"LVL\x0a")
+
+    def test_mesh_not_selected(self):
+        LevelGenerator(200, 10).write(self.filename)
+        reader = LevelReader(vectorized=True, chunks=["layers"])
+        reader.read_level(self.filename)
+        self.assertIsNone(reader.mesh)
+        reader.write_level(self.output)
+        self.assertEqual(self.read(self.output)[:4], b"LVL\x0a")
+
+
+if __name__ == "__main__":
+    unittest.main()